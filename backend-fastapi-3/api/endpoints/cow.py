@@ -1,5 +1,5 @@
 # api/endpoints/cows.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from uuid import UUID
 from typing import List, Optional
 from datetime import datetime, timedelta
@@ -17,7 +17,7 @@ from services.crud_session import (
     get_eating_sessions,
     get_daily_summary,
     get_weekly_summary,
-    get_sessions_for_date
+    get_sessions_grouped_by_date
 )
 from db.postgresql import get_db_connection
 from core.security import get_current_farmer
@@ -176,7 +176,8 @@ async def get_cow_sensor_history(
         end_time=end_time
     )
     
-    return history
+    # JSON sudah dibangun PostgreSQL; response_model hanya untuk skema OpenAPI
+    return Response(content=history, media_type="application/json")
 
 @router.get(
     "/{cow_id}/eating-sessions",
@@ -207,13 +208,13 @@ async def get_cow_daily_summary(
     """Get daily eating summary for a cow"""
     summary = await get_daily_summary(db, cow['cow_id'], days)
     
-    # Get sessions for each day
-    for day in summary:
-        day['sessions'] = await get_sessions_for_date(
-            db, 
-            cow['cow_id'], 
-            day['date'].isoformat()
+    # Get sessions for each day (satu query untuk seluruh rentang)
+    if summary:
+        sessions_by_date = await get_sessions_grouped_by_date(
+            db, cow['cow_id'], summary[0]['date'], summary[-1]['date']
         )
+        for day in summary:
+            day['sessions'] = sessions_by_date.get(day['date'], [])
     
     return {"daily_summaries": summary}
 
@@ -247,14 +248,18 @@ async def get_cow_weekly_summary(
         """, cow['cow_id'], week['week_start'], week['week_end'])
         
         week['daily_summaries'] = [dict(d) for d in week_days]
-        
-        # Get sessions for each day
-        for day in week['daily_summaries']:
-            day['sessions'] = await get_sessions_for_date(
-                db,
-                cow['cow_id'],
-                day['date'].isoformat()
-            )
+    
+    # Get sessions for each day of all weeks (satu query untuk seluruh rentang)
+    all_days = [day for week in summary for day in week['daily_summaries']]
+    if all_days:
+        sessions_by_date = await get_sessions_grouped_by_date(
+            db,
+            cow['cow_id'],
+            min(day['date'] for day in all_days),
+            max(day['date'] for day in all_days)
+        )
+        for day in all_days:
+            day['sessions'] = sessions_by_date.get(day['date'], [])
     
     return {
         "current_week": summary[0] if len(summary) > 0 else None,
@@ -1,6 +1,9 @@
 # core/config.py
+from pathlib import Path
 from pydantic_settings import BaseSettings
 
+BASE_DIR = Path(__file__).resolve().parent.parent
+
 class Settings(BaseSettings):
     POSTGRE_URI: str 
     JWT_SECRET_KEY: str
@@ -14,6 +17,10 @@ class Settings(BaseSettings):
     SMTP_USERNAME: str
     SMTP_PASSWORD: str
     EMAIL_SENDER: str = "alerts@yourdomain.com"
+    SENSOR_INSERT_USE_COPY: bool = True # COPY biner untuk flush output_sensor
+    MODEL_CACHE_DIR: str = str(BASE_DIR / "model_cache") # Salinan lokal model_data per model_id (path absolut)
+    MQTT_BUFFER_SIZE: int = 5000 # Flush output_sensor saat jumlah baris mencapai ini
+    MQTT_BUFFER_MAX_LATENCY: float = 1.0 # ...atau saat baris tertua sudah menunggu selama ini (detik)
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,26 @@
+# core/logging_setup.py
+import logging
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+def setup_logging(level: int = logging.INFO) -> QueueListener:
+    """
+    Logger root hanya memasukkan record ke antrian (QueueHandler); penulisan
+    ke stderr dilakukan thread QueueListener, sehingga jalur MQTT tidak
+    menunggu syscall write. Kembalikan listener agar bisa di-stop saat shutdown.
+    """
+    log_queue: SimpleQueue = SimpleQueue()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(log_queue))
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -1,19 +1,51 @@
 # db/postgresql.py
 import asyncpg
+try:
+    import orjson
+    def _json_dumps(value) -> str:
+        # Metrik model (mis. IsolationForest.threshold_) bisa berupa skalar NumPy
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    _json_loads = orjson.loads
+except ImportError: # Fallback ke json bawaan
+    import json
+    def _json_default(value):
+        if hasattr(value, "item"): # Skalar NumPy -> tipe Python
+            return value.item()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    def _json_dumps(value) -> str:
+        return json.dumps(value, default=_json_default)
+    _json_loads = json.loads
 from core.config import settings
 from typing import AsyncGenerator
 from fastapi import HTTPException
 
 db_pool: asyncpg.Pool = None
 
+# Semua koneksi dibuka saat startup (min_size == max_size), jadi tidak ada
+# handshake TCP/auth di jalur MQTT. Ukuran mencakup flush paralel
+# (mqtt.client.FLUSH_CONCURRENCY), start/finalize sesi, task ML, dan request HTTP.
+POOL_SIZE = 20
+
+async def _init_connection(connection: asyncpg.Connection):
+    # Kolom JSON/JSONB langsung menjadi objek Python (dan sebaliknya), tanpa json.loads per baris
+    for type_name in ('json', 'jsonb'):
+        await connection.set_type_codec(
+            type_name,
+            encoder=_json_dumps,
+            decoder=_json_loads,
+            schema='pg_catalog',
+            format='text'
+        )
+
 async def connect_to_db() -> asyncpg.Pool:
     global db_pool
     print("Connecting to database...")
     try:
         pool = await asyncpg.create_pool(
             settings.POSTGRE_URI,
-            min_size=5,
-            max_size=20
+            min_size=POOL_SIZE,
+            max_size=POOL_SIZE,
+            init=_init_connection
         )
         print("Database connection pool established.")
         
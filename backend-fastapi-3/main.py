@@ -4,25 +4,31 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import asyncpg
 from db.postgresql import connect_to_db, close_db_connection, get_db_connection
+from core.logging_setup import setup_logging
 import asyncio
 from fastapi import Request
 
 # from services.email import check_smtp_async
 from api.api_router import api_router
-from mqtt.client import mqtt_listener_task, session_timeout_checker_task
+from mqtt.client import mqtt_listener_task, session_timeout_checker_task, buffer_flush_task, broadcast_flusher_task, drain_pending_flushes
 from ml.tasks import periodic_training_task, periodic_prediction_task
 
 mqtt_task = None
 session_task = None 
+flush_task = None
+broadcast_task = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global mqtt_task, session_task 
+    global mqtt_task, session_task, flush_task, broadcast_task
     
+    log_listener = setup_logging()
     pool = await connect_to_db()
     
     mqtt_task = asyncio.create_task(mqtt_listener_task(pool))
     session_task = asyncio.create_task(session_timeout_checker_task(pool)) # <-- Jalankan task timeout
+    flush_task = asyncio.create_task(buffer_flush_task(pool))
+    broadcast_task = asyncio.create_task(broadcast_flusher_task())
     ml_training_task = asyncio.create_task(periodic_training_task(pool))
     # ml_prediction_task = asyncio.create_task(periodic_prediction_task(pool))
 
@@ -42,6 +48,20 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             print("Session timeout checker task successfully cancelled.")
 
+    if flush_task:
+        flush_task.cancel()
+        try:
+            await flush_task
+        except asyncio.CancelledError:
+            print("Buffer flush task successfully cancelled.")
+
+    if broadcast_task:
+        broadcast_task.cancel()
+        try:
+            await broadcast_task
+        except asyncio.CancelledError:
+            print("Broadcast flusher task successfully cancelled.")
+
     if ml_training_task:
         ml_training_task.cancel()
         try: await ml_training_task
@@ -51,8 +71,12 @@ async def lifespan(app: FastAPI):
     #     ml_prediction_task.cancel()
     #     try: await ml_prediction_task
     #     except asyncio.CancelledError: print("ML prediction task successfully cancelled.")
+
+    # Tulis data sensor dan skor anomali yang tersisa sebelum pool ditutup
+    await drain_pending_flushes(pool)
  
     await close_db_connection()
+    log_listener.stop()
 
 app = FastAPI(
     title="Backend Capstone D06 v3",
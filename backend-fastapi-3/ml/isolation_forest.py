@@ -96,6 +96,16 @@ class IsolationForest:
         self.trees: List[IsolationTree] = []
         self.max_depth: int = 0
         self.threshold_: float = 0.0 # Threshold untuk anomali
+        self._reset_flat_trees()
+
+    def _reset_flat_trees(self):
+        # Representasi datar (array kontigu) dari semua tree, dipakai saat scoring
+        self.node_feature_: np.ndarray | None = None
+        self.node_threshold_: np.ndarray | None = None
+        self.node_left_: np.ndarray | None = None   # -1 menandakan leaf
+        self.node_right_: np.ndarray | None = None
+        self.node_depth_: np.ndarray | None = None
+        self.tree_roots_: np.ndarray | None = None
 
     def fit(self, X: np.ndarray):
         """Melatih Isolation Forest."""
@@ -117,6 +127,8 @@ class IsolationForest:
             tree.fit(X_sub)
             self.trees.append(tree)
 
+        self._flatten_trees()
+
         # 3. Hitung threshold berdasarkan kontaminasi
         scores = self.score_samples(X)
         # Ambil skor di persentil 'contamination'
@@ -124,12 +136,61 @@ class IsolationForest:
         
         return self
 
-    def _get_avg_path_length(self, x: np.ndarray) -> float:
-        """Mendapatkan rata-rata path length di semua tree."""
-        total_path_length = 0
-        for tree in self.trees:
-            total_path_length += tree.get_path_length(x)
-        return total_path_length / self.n_estimators
+    def _flatten_trees(self):
+        """
+        Mengubah semua tree (objek Node) menjadi array datar per node
+        sehingga traversal bisa dilakukan tervektorisasi untuk seluruh sampel.
+        """
+        features, thresholds, lefts, rights, depths = [], [], [], [], []
+
+        def add_node(node: Node, depth: int) -> int:
+            idx = len(features)
+            features.append(0)
+            thresholds.append(0.0)
+            lefts.append(-1)
+            rights.append(-1)
+            depths.append(depth)
+            if node is not None and not node.is_leaf:
+                features[idx] = node.split_feature
+                thresholds[idx] = node.split_value
+                lefts[idx] = add_node(node.left_child, depth + 1)
+                rights[idx] = add_node(node.right_child, depth + 1)
+            return idx
+
+        roots = [add_node(tree.root, 0) for tree in self.trees]
+
+        # float32/int16 cukup untuk 7 fitur berskala kecil dan memangkas
+        # separuh byte yang dibaca saat traversal
+        self.node_feature_ = np.asarray(features, dtype=np.int16)
+        self.node_threshold_ = np.asarray(thresholds, dtype=np.float32)
+        self.node_left_ = np.asarray(lefts, dtype=np.intp)
+        self.node_right_ = np.asarray(rights, dtype=np.intp)
+        self.node_depth_ = np.asarray(depths, dtype=np.float64)
+        self.tree_roots_ = np.asarray(roots, dtype=np.intp)
+
+    def _get_path_lengths(self, X: np.ndarray) -> np.ndarray:
+        """
+        Menghitung path length setiap sampel di setiap tree sekaligus.
+        Hasil berbentuk (n_trees, n_samples).
+        """
+        # Model lama (hasil joblib sebelum ada array datar) dibangun ulang di sini
+        if getattr(self, 'node_feature_', None) is None:
+            self._flatten_trees()
+
+        n_samples = len(X)
+        n_trees = len(self.tree_roots_)
+
+        node = np.repeat(self.tree_roots_, n_samples)
+        sample_idx = np.tile(np.arange(n_samples), n_trees)
+
+        active = np.flatnonzero(self.node_left_[node] >= 0)
+        while active.size:
+            current = node[active]
+            go_left = X[sample_idx[active], self.node_feature_[current]] <= self.node_threshold_[current]
+            node[active] = np.where(go_left, self.node_left_[current], self.node_right_[current])
+            active = active[self.node_left_[node[active]] >= 0]
+
+        return self.node_depth_[node].reshape(n_trees, n_samples)
 
     def score_samples(self, X: np.ndarray) -> np.ndarray:
         """
@@ -137,11 +198,15 @@ class IsolationForest:
         Mengikuti konvensi sklearn: anomali memiliki SKOR LEBIH RENDAH.
         Kita kembalikan -avg_path_length.
         """
-        scores = [self._get_avg_path_length(x) for x in X]
+        X = np.asarray(X, dtype=np.float32)
+        if len(X) == 0 or not self.trees:
+            return np.zeros(len(X))
+
+        avg_path_length = self._get_path_lengths(X).sum(axis=0) / self.n_estimators
         # Skor adalah negatif dari rata-rata path length
         # Path pendek (anomali) -> skor mendekati 0
         # Path panjang (normal) -> skor sangat negatif
-        return -np.array(scores)
+        return -avg_path_length
 
     def predict(self, X: np.ndarray) -> np.ndarray:
         """
@@ -3,9 +3,9 @@ import asyncio
 import asyncpg
 import joblib
 import numpy as np
-import pandas as pd
 import io
 import json
+import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 from uuid import UUID
@@ -13,76 +13,101 @@ from uuid import UUID
 from ml.isolation_forest import IsolationForest 
 from services import crud_ml
 
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+FEATURE_COUNT = 7
+PREDICTION_CHUNK_SIZE = 10000
 
 def engineer_features(sessions: List[Dict[str, Any]]) -> np.ndarray: # <-- window_size dihapus
     """
     Mengubah list data sesi mentah menjadi array NumPy fitur.
     (Hanya fitur dasar dan siklus waktu).
-    """
-    if not sessions:
-        return np.empty((0, 7))
-
-    df = pd.DataFrame(sessions)
-
-    df['duration_sec'] = (df['time_end'] - df['time_start']).apply(lambda x: x.total_seconds())
-    df['duration_min'] = df['duration_sec'] / 60.0
-    df['total_consumption'] = df['weight_start'] - df['weight_end']
-    
-    df['rate_per_min'] = 0.0
-    mask = df['duration_sec'] > 0
-    df.loc[mask, 'rate_per_min'] = (df['total_consumption'][mask] / df['duration_sec'][mask]) * 60
 
-    df['hour_sin'] = np.sin(2 * np.pi * df['time_start'].dt.hour / 24.0)
-    df['hour_cos'] = np.cos(2 * np.pi * df['time_start'].dt.hour / 24.0)
-    df['day_of_week'] = df['time_start'].dt.weekday
-
-    df['avg_temp'] = df['average_temp']
-
-    df.replace([np.inf, -np.inf], np.nan, inplace=True)
-    df.fillna(0, inplace=True)
-
-    feature_columns = [
-        'duration_min', 'total_consumption', 'rate_per_min',
-        'hour_sin', 'hour_cos', 'day_of_week',
-        'avg_temp'
-    ]
-    
-    return df[feature_columns].values
+    Kolom: duration_min, total_consumption, rate_per_min,
+    hour_sin, hour_cos, day_of_week, avg_temp.
+    """
+    n = len(sessions)
+    if n == 0:
+        return np.empty((0, FEATURE_COUNT), dtype=np.float32)
+
+    # Ambil kolom langsung dari list dict, tanpa DataFrame perantara
+    ts_start = np.fromiter((s['time_start'].timestamp() for s in sessions), dtype=np.float64, count=n)
+    ts_end = np.fromiter((s['time_end'].timestamp() for s in sessions), dtype=np.float64, count=n)
+    w_start = np.fromiter((s['weight_start'] for s in sessions), dtype=np.float64, count=n)
+    w_end = np.fromiter((s['weight_end'] for s in sessions), dtype=np.float64, count=n)
+    temp = np.fromiter(
+        (np.nan if s.get('average_temp') is None else s['average_temp'] for s in sessions),
+        dtype=np.float64, count=n
+    )
+
+    # Waktu epoch tetap dihitung dalam float64; fitur akhir cukup float32
+    X = np.empty((n, FEATURE_COUNT), dtype=np.float32)
+
+    duration_sec = ts_end - ts_start
+    np.divide(duration_sec, 60.0, out=X[:, 0])
+    np.subtract(w_start, w_end, out=X[:, 1])
+
+    # Pembagian aman; durasi <= 0 menghasilkan rate 0
+    X[:, 2] = 0.0
+    np.divide(X[:, 1], duration_sec, out=X[:, 2], where=duration_sec > 0)
+    X[:, 2] *= 60.0
+
+    hour_angle = 2 * np.pi * ((ts_start // SECONDS_PER_HOUR) % 24) / 24.0
+    np.sin(hour_angle, out=X[:, 3])
+    np.cos(hour_angle, out=X[:, 4])
+    # 1970-01-01 adalah hari Kamis (weekday 3)
+    X[:, 5] = (ts_start // SECONDS_PER_DAY + 3) % 7
+
+    X[:, 6] = temp
+
+    np.nan_to_num(X, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+    return X
+
+def build_model_metrics(model: IsolationForest, X_train: np.ndarray) -> Dict[str, Any]:
+    """
+    Metrik yang disimpan ke kolom JSONB. Nilai dikonversi ke tipe Python
+    (threshold_ adalah numpy.float64) agar aman untuk codec JSON.
+    """
+    return {
+        "feature_count": int(X_train.shape[1]),
+        "session_count": int(X_train.shape[0]),
+        "anomaly_threshold": float(model.threshold_)
+    }
 
 async def train_model_for_cow(pool: asyncpg.Pool, cow_id: UUID):
     print(f"(ML Training) Memulai training untuk Sapi: {cow_id}")
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=30)
+
+    # Koneksi hanya dipinjam selama query; fit dan dump tidak butuh DB
     db: asyncpg.Connection
     async with pool.acquire() as db:
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=30)
-        
         session_records = await crud_ml.get_sessions_for_training(db, cow_id, start_date, end_date)
-        
-        if len(session_records) < 10:
-            print(f"(ML Training) Gagal: Data tidak cukup untuk Sapi {cow_id} (hanya {len(session_records)} sesi).")
-            return
+    
+    if len(session_records) < 10:
+        print(f"(ML Training) Gagal: Data tidak cukup untuk Sapi {cow_id} (hanya {len(session_records)} sesi).")
+        return
 
-        sessions = [dict(record) for record in session_records]
-        X_train = engineer_features(sessions)
-        
-        if X_train.size == 0:
-             print(f"(ML Training) Gagal: Feature engineering menghasilkan data kosong untuk Sapi {cow_id}.")
-             return
+    sessions = [dict(record) for record in session_records]
+    X_train = engineer_features(sessions)
+    
+    if X_train.size == 0:
+         print(f"(ML Training) Gagal: Feature engineering menghasilkan data kosong untuk Sapi {cow_id}.")
+         return
 
-        model = IsolationForest(contamination=0.05)
-        model.fit(X_train)
-        
-        model_buffer = io.BytesIO()
-        joblib.dump(model, model_buffer)
-        model_data = model_buffer.getvalue()
-        
-        model_version = f"iforest-v3-base-{end_date.strftime('%Y%m%d')}"
-        metrics = {
-            "feature_count": X_train.shape[1], 
-            "session_count": X_train.shape[0],
-            "anomaly_threshold": model.threshold_
-        }
-        
+    model = IsolationForest(contamination=0.05)
+    model.fit(X_train)
+    
+    model_buffer = io.BytesIO()
+    joblib.dump(model, model_buffer)
+    model_data = model_buffer.getvalue()
+    
+    model_version = f"iforest-v3-base-{end_date.strftime('%Y%m%d')}"
+    metrics = build_model_metrics(model, X_train)
+    
+    async with pool.acquire() as db:
         await crud_ml.save_new_model(
             db, cow_id, model_version, model_data, 
             metrics, start_date, end_date
@@ -116,19 +141,27 @@ async def run_prediction_cycle(pool: asyncpg.Pool):
     """
     Menjalankan satu siklus prediksi penuh untuk sesi yang belum dinilai.
     (Logika disederhanakan karena tidak perlu mengambil riwayat).
+
+    Sesi diproses per chunk (PREDICTION_CHUNK_SIZE) agar memori terbatas,
+    dan koneksi pool hanya dipinjam selama masing-masing query.
     """
     print(f"(ML Prediction) [Cycle Start] Memulai siklus prediksi...")
     
     loaded_models: Dict[UUID, IsolationForest] = {}
+    cursor = None
+    total_sessions = 0
     
-    db: asyncpg.Connection
-    async with pool.acquire() as db:
-        unscored_sessions = await crud_ml.get_unscored_sessions(db)
+    while True:
+        db: asyncpg.Connection
+        async with pool.acquire() as db:
+            unscored_sessions = await crud_ml.get_unscored_sessions(
+                db, limit=PREDICTION_CHUNK_SIZE, after=cursor
+            )
         if not unscored_sessions:
-            print("(ML Prediction) Tidak ada sesi baru untuk dinilai.")
-            return
+            break
             
         print(f"(ML Prediction) Menilai {len(unscored_sessions)} sesi baru...")
+        total_sessions += len(unscored_sessions)
         
         results_to_save = []
         
@@ -138,7 +171,8 @@ async def run_prediction_cycle(pool: asyncpg.Pool):
             
             try:
                 if cow_id not in loaded_models:
-                    model_record_raw = await crud_ml.get_active_model_for_cow(db, cow_id)
+                    async with pool.acquire() as db:
+                        model_record_raw = await crud_ml.get_active_model_for_cow(db, cow_id)
                     if not model_record_raw:
                         print(f"Warning: Tidak ada model aktif untuk Sapi {cow_id}. Sesi dilewati.")
                         continue
@@ -176,7 +210,26 @@ async def run_prediction_cycle(pool: asyncpg.Pool):
                 print(f"Error menilai sesi {session.get('session_id')}: {e}")
 
         if results_to_save:
-            await crud_ml.save_anomaly_scores(db, results_to_save)
+            try:
+                async with pool.acquire() as db:
+                    await crud_ml.save_anomaly_scores(db, results_to_save)
+            except Exception:
+                # Hentikan siklus tanpa memajukan cursor: sesi chunk ini tetap
+                # belum dinilai dan akan diambil ulang pada siklus berikutnya
+                logger.exception(
+                    "(ML Prediction) Gagal menyimpan %s skor anomali; siklus dihentikan.",
+                    len(results_to_save)
+                )
+                return
+
+        if len(unscored_sessions) < PREDICTION_CHUNK_SIZE:
+            break
+        last_session = unscored_sessions[-1]
+        cursor = (last_session['time_start'], last_session['session_id'])
+
+    if total_sessions == 0:
+        print("(ML Prediction) Tidak ada sesi baru untuk dinilai.")
+        return
 
     print("(ML Prediction) [Cycle End] Siklus prediksi selesai.")
 
@@ -1,169 +1,407 @@
 # mqtt/client.py
 import asyncio
-import json
+import heapq
+import logging
+try:
+    import orjson
+    _json_loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError: # Fallback: json.loads juga menerima bytes
+    import json
+    _json_loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
 import asyncpg
 import aiomqtt
-from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from itertools import chain, count
+from datetime import datetime, timedelta, timezone
 from typing import List, Tuple, Dict, Any
 from uuid import UUID
 import joblib
-import io    
+import os
+import math
+import tempfile
+import time
 import numpy as np
 
 from core.config import settings
-from services.crud_sensor import batch_insert_sensor_data 
+from services.crud_sensor import batch_insert_sensor_data
 from services.crud_device import upsert_device_status
-from services.crud_rfid import upsert_rfid_tags
-from services.crud_session import get_active_cow_by_rfid, create_eat_session
+from services.crud_rfid import upsert_rfid_tags, get_recent_rfid_ids
+from services.crud_session import get_active_cow_by_rfid, get_cached_cow_by_rfid, create_eat_session
 from services import crud_ml, crud_cow, authentication
 # from services.email import send_anomaly_alert
-from ml.tasks import engineer_features
+from ml.tasks import FEATURE_COUNT, SECONDS_PER_HOUR, SECONDS_PER_DAY
 from streaming.broker import streaming_broker
 
-MQTT_DATA_BUFFER: List[Dict[str, Any]] = []
-BUFFER_SIZE = 100 
-BUFFER_TIMEOUT = 5.0 
+logger = logging.getLogger(__name__)
 
-ACTIVE_SESSIONS: Dict[str, Dict[str, Any]] = {}
+SUBSCRIPTION_TOPIC = settings.MQTT_TOPIC_PREFIX
+
+BUFFER_SIZE = settings.MQTT_BUFFER_SIZE
+BUFFER_MAX_LATENCY = settings.MQTT_BUFFER_MAX_LATENCY
+# Batas baris yang ditahan saat DB bermasalah; baris tertua dibuang bila penuh
+MAX_BUFFERED_ROWS = BUFFER_SIZE * 4
+
+# Buffer kolumnar (SoA): satu deque berbatas per kolom output_sensor, tanpa dict per pesan
+_ts_buf: "deque[datetime]" = deque(maxlen=MAX_BUFFERED_ROWS)
+_dev_buf: "deque[str]" = deque(maxlen=MAX_BUFFERED_ROWS)
+_rfid_buf: "deque[str | None]" = deque(maxlen=MAX_BUFFERED_ROWS)
+_w_buf: "deque[float | None]" = deque(maxlen=MAX_BUFFERED_ROWS)
+_t_buf: "deque[float | None]" = deque(maxlen=MAX_BUFFERED_ROWS)
+_ip_buf: "deque[str | None]" = deque(maxlen=MAX_BUFFERED_ROWS)
+_dropped_rows = 0 # Jumlah baris sensor yang dibuang karena buffer penuh
+DROP_LOG_INTERVAL = 10.0 # Detik; warning buffer penuh dicatat paling sering sekali per interval
+_dropped_since_log = 0
+_last_drop_log = float("-inf")
+
+# RFID yang sudah pasti ada di rfid_tag (LRU), agar upsert no-op tidak diulang tiap flush
+_recent_rfids: "OrderedDict[str, None]" = OrderedDict()
+RECENT_RFID_CACHE_SIZE = 10_000
+
+FLUSH_CONCURRENCY = 2 # Maksimal task flush yang berjalan sekaligus (bukan hanya yang menulis)
+_flush_tasks: set = set() # Referensi task flush agar tidak di-GC sebelum selesai
+_flush_event = asyncio.Event() # Di-set saat buffer mulai terisi dan saat mencapai BUFFER_SIZE
+
+@dataclass(slots=True)
+class SessionState:
+    """State satu sesi makan yang sedang berjalan di sebuah device."""
+    rfid_id: str
+    cow_id: UUID
+    time_start: datetime
+    weight_start: float
+    last_weight: float
+    last_seen: datetime
+    last_consumption_time: datetime
+    temp_mean: float # Rata-rata berjalan (Welford), tidak perlu dibagi saat finalize
+    temp_count: int
+
+ACTIVE_SESSIONS: Dict[str, SessionState] = {}
+
+# Min-heap (deadline, seq, device_id, state); satu entri per sesi aktif, deadline
+# diperbarui secara lazy saat entri di-pop sehingga pengecekan timeout O(k log N)
+_session_deadlines: List[Tuple[datetime, int, str, SessionState]] = []
+_deadline_seq = count() # Pemecah seri agar SessionState tidak pernah dibandingkan
+
+# cow_id -> sensor_update yang belum disiarkan
+_broadcast_queues: Dict[UUID, List[Dict[str, Any]]] = {}
+BROADCAST_INTERVAL = 0.1
+
+# (model_id, session_id, anomaly_score, is_anomaly) yang menunggu ditulis batch.
+# Berbatas: saat DB bermasalah skor tertua dibuang, bukan memori yang terus tumbuh
+MAX_ANOMALY_BUFFER = 10_000
+MAX_ANOMALY_FLUSH_RETRIES = 5 # Gagal koneksi berturut-turut sebelum batch dibuang
+_ANOMALY_BUFFER: "deque[Tuple]" = deque(maxlen=MAX_ANOMALY_BUFFER)
+_anomaly_flush_failures = 0
+_dropped_anomaly_scores = 0 # Jumlah skor anomali yang dibuang
+
+# cow_id -> (model_id, model) yang sudah di-joblib.load, LRU sebanyak MODEL_CACHE_SIZE
+_MODEL_CACHE: "OrderedDict[UUID, Tuple[UUID, Any]]" = OrderedDict()
+MODEL_CACHE_SIZE = 128
 
 SESSION_TIMEOUT_SECONDS = 30 # Perlu diganti 60 
+SESSION_TIMEOUT = timedelta(seconds=SESSION_TIMEOUT_SECONDS)
 NOISE_THRESHOLD = 0.005 
 
 WEIGHT_START_THRESHOLD = 0.05 
 
+# Rentang epoch milidetik yang diterima dari payload "ts" numerik
+MIN_CLIENT_TS_MS = 1_577_836_800_000 # 2020-01-01 UTC
+MAX_CLIENT_TS_MS = 4_102_444_800_000 # 2100-01-01 UTC
+
+def _take_buffer() -> Tuple[deque, ...] | None:
+    """Ambil isi buffer dan ganti dengan deque kosong (sinkron, tanpa await)."""
+    global _ts_buf, _dev_buf, _rfid_buf, _w_buf, _t_buf, _ip_buf
+    if not _ts_buf:
+        return None
+
+    columns = (_ts_buf, _dev_buf, _rfid_buf, _w_buf, _t_buf, _ip_buf)
+    _ts_buf, _dev_buf, _rfid_buf, _w_buf, _t_buf, _ip_buf = (
+        deque(maxlen=MAX_BUFFERED_ROWS) for _ in range(6)
+    )
+    return columns
+
+def _record_dropped(dropped: int):
+    """
+    Hitung baris yang dibuang. Dipanggil per pesan saat buffer penuh, jadi
+    warning dibatasi sekali per DROP_LOG_INTERVAL agar log tidak banjir.
+    """
+    global _dropped_rows, _dropped_since_log, _last_drop_log
+    _dropped_rows += dropped
+    _dropped_since_log += dropped
+    now = time.monotonic()
+    if now - _last_drop_log >= DROP_LOG_INTERVAL:
+        logger.warning(
+            "MQTT buffer full: dropped %s oldest rows since last report (total dropped: %s)",
+            _dropped_since_log, _dropped_rows
+        )
+        _dropped_since_log = 0
+        _last_drop_log = now
+
+def _requeue_batch(columns: Tuple[deque, ...]):
+    """
+    Kembalikan batch yang gagal ke depan buffer dengan urutan terjaga.
+    Bila melebihi MAX_BUFFERED_ROWS, baris tertua yang dibuang.
+    """
+    global _ts_buf, _dev_buf, _rfid_buf, _w_buf, _t_buf, _ip_buf
+    dropped = len(columns[0]) + len(_ts_buf) - MAX_BUFFERED_ROWS
+    _ts_buf, _dev_buf, _rfid_buf, _w_buf, _t_buf, _ip_buf = (
+        deque(chain(old, current), maxlen=MAX_BUFFERED_ROWS)
+        for old, current in zip(columns, (_ts_buf, _dev_buf, _rfid_buf, _w_buf, _t_buf, _ip_buf))
+    )
+    if dropped > 0:
+        _record_dropped(dropped)
+
 async def flush_buffer_to_db(pool: asyncpg.Pool):
-    global MQTT_DATA_BUFFER
-    if not MQTT_DATA_BUFFER:
-        return
+    columns = _take_buffer()
+    if columns:
+        await _write_batch(pool, columns)
 
-    current_batch_dicts = MQTT_DATA_BUFFER
-    MQTT_DATA_BUFFER = []
-    
-    device_updates: Dict[str, Tuple(str, datetime)] = {}
-    output_sensor_batch: List[Tuple] = []
-    rfid_ids_to_register: set = set() 
-
-    for msg in current_batch_dicts:
-        output_sensor_batch.append((
-            msg['timestamp'], 
-            msg['device_id'],
-            msg['rfid_id'],
-            msg['weight'],
-            msg['temperature_c'],
-            msg['ip']
-        ))
-        device_updates[msg['device_id']] = (msg['ip'], msg['timestamp'])
-        rfid = msg.get('rfid_id')
-        if rfid:
-            rfid_ids_to_register.add(rfid)
+def schedule_flush(pool: asyncpg.Pool) -> bool:
+    """
+    Ambil snapshot buffer sekarang dan tulis ke DB di background task,
+    agar listener MQTT tidak menunggu. Bila sudah ada FLUSH_CONCURRENCY task
+    (DB lambat), tidak ada snapshot yang diambil: baris tetap di deque berbatas
+    sehingga back-pressure MAX_BUFFERED_ROWS tetap berlaku.
+    Mengembalikan True jika flush dijadwalkan.
+    """
+    if len(_flush_tasks) >= FLUSH_CONCURRENCY:
+        return False
+    columns = _take_buffer()
+    if not columns:
+        return False
+
+    task = asyncio.create_task(_write_batch(pool, columns))
+    _flush_tasks.add(task)
+    task.add_done_callback(_flush_tasks.discard)
+    return True
+
+async def drain_pending_flushes(pool: asyncpg.Pool):
+    """
+    Tunggu flush background yang masih berjalan, lalu tulis sisa buffer sensor
+    dan skor anomali yang tertunda (sesinya sudah di-commit, jadi skor yang
+    hilang tidak akan pernah dinilai ulang).
+    """
+    if _flush_tasks:
+        await asyncio.gather(*_flush_tasks, return_exceptions=True)
+    await flush_buffer_to_db(pool)
+    await flush_anomaly_buffer(pool)
+
+async def _write_batch(pool: asyncpg.Pool, columns: Tuple[deque, ...]):
+    ts, dev, rfid, w, t, ip = columns
+
+    output_sensor_batch: List[Tuple] = list(zip(ts, dev, rfid, w, t, ip))
+    # Entri terakhir per device yang menang
+    device_updates: Dict[str, Tuple[str, datetime]] = dict(zip(dev, zip(ip, ts)))
+    # Unik; RFID yang baru saja di-upsert dilewati.
+    # Kedua batch upsert diurutkan per key agar flush yang berjalan bersamaan
+    # (FLUSH_CONCURRENCY) selalu mengunci baris device/rfid_tag dengan urutan
+    # yang sama dan tidak saling deadlock.
+    batch_rfids = set(rfid)
+    rfid_upsert_batch = [
+        (rfid_id,) for rfid_id in sorted(batch_rfids - _recent_rfids.keys() - {None, ""})
+    ]
+    # Hit menyegarkan posisi LRU, agar tag yang sering terlihat tidak tergusur
+    for rfid_id in batch_rfids & _recent_rfids.keys():
+        _recent_rfids.move_to_end(rfid_id)
 
     device_upsert_batch = [
         (device_id, data[0], data[1]) 
-        for device_id, data in device_updates.items()
+        for device_id, data in sorted(device_updates.items())
     ]
-    rfid_upsert_batch = [(rfid,) for rfid in rfid_ids_to_register]
     
     try:
-        async with pool.acquire() as connection:
+        # Satu transaksi: ketiga batch gagal/berhasil bersama
+        async with pool.acquire() as connection, connection.transaction():
             if device_upsert_batch:
                 await upsert_device_status(connection, device_upsert_batch)
             if rfid_upsert_batch:
                 await upsert_rfid_tags(connection, rfid_upsert_batch)
             if output_sensor_batch:
                 await batch_insert_sensor_data(connection, output_sensor_batch)
+        # Tandai sebagai terdaftar hanya setelah commit berhasil
+        for (rfid_id,) in rfid_upsert_batch:
+            _recent_rfids[rfid_id] = None
+        while len(_recent_rfids) > RECENT_RFID_CACHE_SIZE:
+            _recent_rfids.popitem(last=False)
     except Exception as e:
-        print(f"Failed to flush MQTT buffer to DB: {e}")
-        MQTT_DATA_BUFFER.extend(current_batch_dicts)
+        logger.error("Failed to flush MQTT buffer to DB: %s", e)
+        _requeue_batch(columns)
+
+def _predict(model, features: np.ndarray) -> Tuple[float, int]:
+    """Skor dan prediksi dalam satu panggilan thread."""
+    return model.score_samples(features)[0], model.predict(features)[0]
+
+def _write_model_file(model_path: str, model_data: bytes):
+    """
+    Tulis blob model secara atomik (file sementara lalu rename). Nama file
+    sementara unik per penulis, sehingga dua finalisasi yang memuat model yang
+    sama bersamaan tidak saling menimpa sebelum os.replace.
+    """
+    model_dir = os.path.dirname(model_path)
+    os.makedirs(model_dir, exist_ok=True)
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=model_dir, suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            f.write(model_data)
+        os.replace(tmp_path, model_path)
+    except BaseException:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def _prune_model_files(model_dir: str, active_ids: set):
+    """Hapus salinan model yang model_id-nya sudah tidak aktif."""
+    keep = {f"{model_id}.joblib" for model_id in active_ids}
+    try:
+        file_names = os.listdir(model_dir)
+    except FileNotFoundError:
+        return
+    for file_name in file_names:
+        if file_name.endswith(".joblib") and file_name not in keep:
+            try:
+                os.unlink(os.path.join(model_dir, file_name))
+            except FileNotFoundError:
+                pass # Sudah dihapus oleh pemanggil lain
+
+async def prune_model_cache(db: asyncpg.Connection):
+    """Sinkronkan MODEL_CACHE_DIR dengan model aktif di DB."""
+    active_ids = await crud_ml.get_active_model_ids(db)
+    await asyncio.to_thread(_prune_model_files, settings.MODEL_CACHE_DIR, active_ids)
+
+async def get_model_for_cow(db: asyncpg.Connection, cow_id: UUID) -> Tuple[UUID | None, Any]:
+    """
+    Mengambil model aktif untuk sapi. Model hasil joblib.load disimpan di
+    _MODEL_CACHE dan hanya dimuat ulang jika model_id aktif berubah.
+    """
+    model_id = await crud_ml.get_active_model_id_for_cow(db, cow_id)
+    if not model_id:
+        return None, None
+
+    cached = _MODEL_CACHE.get(cow_id)
+    if cached and cached[0] == model_id:
+        _MODEL_CACHE.move_to_end(cow_id)
+        return cached
+
+    # BYTEA hanya ditarik dari DB sekali per model_id; selanjutnya dibaca dari disk
+    model_path = os.path.join(settings.MODEL_CACHE_DIR, f"{model_id}.joblib")
+    if not os.path.exists(model_path):
+        model_data = await crud_ml.get_model_data(db, model_id)
+        if model_data is None:
+            return None, None
+        await asyncio.to_thread(_write_model_file, model_path, model_data)
+        # model_id baru berarti ada model yang baru saja dinonaktifkan; buang file lamanya.
+        # Model yang sudah di-mmap tetap valid walau file-nya di-unlink.
+        try:
+            await prune_model_cache(db)
+        except Exception as e:
+            logger.error("Failed to prune model cache: %s", e)
+    # Deserialisasi model bersifat CPU-bound; jalankan di thread agar event loop tidak tertahan.
+    # Array NumPy di dalam model di-mmap sehingga berbagi page cache.
+    model = await asyncio.to_thread(joblib.load, model_path, mmap_mode='r')
+
+    _MODEL_CACHE[cow_id] = (model_id, model)
+    _MODEL_CACHE.move_to_end(cow_id)
+    if len(_MODEL_CACHE) > MODEL_CACHE_SIZE:
+        _MODEL_CACHE.popitem(last=False)
+    return model_id, model
+
+def _features_for_session(
+    state: SessionState,
+    last_weight: float,
+    last_timestamp: datetime,
+    avg_temp: float
+) -> np.ndarray:
+    """
+    Versi satu-baris dari engineer_features untuk inferensi realtime:
+    langsung mengisi array (1, FEATURE_COUNT) float32 dari state sesi.
+    Urutan dan rumus kolom harus sama dengan engineer_features.
+    """
+    ts_start = state.time_start.timestamp()
+    duration_sec = last_timestamp.timestamp() - ts_start
+    total_consumption = state.weight_start - last_weight
+    rate_per_min = total_consumption / duration_sec * 60.0 if duration_sec > 0 else 0.0
+    hour_angle = 2 * math.pi * ((ts_start // SECONDS_PER_HOUR) % 24) / 24.0
+
+    features = np.empty((1, FEATURE_COUNT), dtype=np.float32)
+    features[0] = (
+        duration_sec / 60.0,
+        total_consumption,
+        rate_per_min,
+        math.sin(hour_angle),
+        math.cos(hour_angle),
+        (ts_start // SECONDS_PER_DAY + 3) % 7,
+        avg_temp
+    )
+    return features
 
 async def realtime_predict_and_save(
     db: asyncpg.Connection, 
-    session_data: dict, 
+    current_features: np.ndarray, 
     cow_id: UUID
-) -> Tuple[float | None, bool]:
+) -> Tuple[UUID | None, float | None, bool]:
     """
-    Muat model, engineer fitur, prediksi, dan simpan hasilnya ke tabel anomaly.
+    Muat model (dari cache) dan prediksi fitur satu sesi.
+    Mengembalikan (model_id, score, is_anomaly).
     """
-    model_record = await crud_ml.get_active_model_for_cow(db, cow_id)
-    
-    if not model_record:
-        print(f"Warning: Tidak ada model aktif untuk Sapi {cow_id}. Lewati prediksi.")
-        return None, False
-
-    model_buffer = io.BytesIO(model_record['model_data'])
     try:
-        model = joblib.load(model_buffer)
+        model_id, model = await get_model_for_cow(db, cow_id)
     except Exception as e:
-        print(f"Error loading model: {e}")
-        return None, False
+        logger.error("Error loading model: %s", e)
+        return None, None, False
 
-    features_array = engineer_features([session_data])
-    if features_array.size == 0:
-        return None, False
+    if model is None:
+        logger.warning("Tidak ada model aktif untuk Sapi %s. Lewati prediksi.", cow_id)
+        return None, None, False
 
-    current_features = features_array[0].reshape(1, -1)
-    
-    score = model.score_samples(current_features)[0]
-    prediction = model.predict(current_features)[0]
+    score, prediction = await asyncio.to_thread(_predict, model, current_features)
     is_anomaly = True if prediction == -1 else False
     
-    return float(score), is_anomaly
+    return model_id, float(score), is_anomaly
 
 async def finalize_session(pool: asyncpg.Pool, device_id: str, last_weight: float, last_timestamp: datetime):
     state = ACTIVE_SESSIONS.pop(device_id, None)
     if not state:
         return
     
-    avg_temp = 0.0
-    if state['temp_count'] > 0:
-        avg_temp = state['temp_sum'] / state['temp_count']
+    avg_temp = state.temp_mean
 
-    session_data_to_save = {
-        "device_id": device_id,
-        "rfid_id": state['rfid_id'],
-        "cow_id": state['cow_id'],
-        "time_start": state['time_start'],
-        "time_end": last_timestamp,
-        "weight_start": state['weight_start'],
-        "weight_end": last_weight,
-        "average_temp": avg_temp
-    }
+    session_features = _features_for_session(state, last_weight, last_timestamp, avg_temp)
     
     anomaly_score, is_anomaly = None, False
     model_id = None
     farmer_id = None
     
     async with pool.acquire() as db:
-        owner_id = await crud_cow.get_farmer_id_by_cow_id(db, state['cow_id'])
+        owner_id = await crud_cow.get_farmer_id_by_cow_id(db, state.cow_id)
         if owner_id:
             farmer_id = owner_id
-        anomaly_score, is_anomaly = await realtime_predict_and_save(
-            db, session_data_to_save, state['cow_id']
+        model_id, anomaly_score, is_anomaly = await realtime_predict_and_save(
+            db, session_features, state.cow_id
         )
         farmer_email = await authentication.get_farmer_email_by_id(db, farmer_id)
         
-        model_record = await crud_ml.get_active_model_for_cow(db, state['cow_id'])
-        if model_record:
-            model_id = model_record['model_id']
-        
         session_id = await create_eat_session(
             db=db,
             device_id=device_id,
-            rfid_id=state['rfid_id'],
-            cow_id=state['cow_id'],
-            time_start=state['time_start'],
+            rfid_id=state.rfid_id,
+            cow_id=state.cow_id,
+            time_start=state.time_start,
             time_end=last_timestamp,
-            weight_start=state['weight_start'],
+            weight_start=state.weight_start,
             weight_end=last_weight,
             average_temp=avg_temp
         )
 
-        if session_id and model_id and is_anomaly is not None:
-            final_anomaly_data = [(model_id, session_id, anomaly_score, is_anomaly)]
-            await crud_ml.save_anomaly_scores(db, final_anomaly_data)
+    # Sesi sudah di-commit, jadi skor anomali aman ditulis belakangan secara batch
+    if session_id and model_id and is_anomaly is not None:
+        _buffer_anomaly_scores([(model_id, session_id, anomaly_score, is_anomaly)])
 
 
     end_message = {
-        "cow_id": str(state['cow_id']),
+        "cow_id": str(state.cow_id),
         "event": "session_end",
         "device_id": device_id,
         "timestamp": last_timestamp.isoformat(),
@@ -171,27 +409,28 @@ async def finalize_session(pool: asyncpg.Pool, device_id: str, last_weight: floa
         "anomaly": is_anomaly,
         "score": anomaly_score
     }
-    await streaming_broker.broadcast(state['cow_id'], end_message)
-    print(f"(SESSION END) Cow {state['cow_id']} finished. Anomaly: {is_anomaly}")
+    await flush_pending_broadcasts(state.cow_id)
+    await streaming_broker.broadcast(state.cow_id, end_message)
+    logger.info("(SESSION END) Cow %s finished. Anomaly: %s", state.cow_id, is_anomaly)
     
     if farmer_id:
         await streaming_broker.broadcast(farmer_id, end_message)
         if is_anomaly:
             alert_msg = {
-                "cow_id": str(state['cow_id']), 
+                "cow_id": str(state.cow_id), 
                 "event": "ANOMALY_ALERT",
-                "message": f"ALERT: Anomali terdeteksi! Sapi {state['cow_id']} ({avg_temp:.2f}°C)."
+                "message": f"ALERT: Anomali terdeteksi! Sapi {state.cow_id} ({avg_temp:.2f}°C)."
             }
             await streaming_broker.broadcast(farmer_id, alert_msg)
         # if is_anomaly and farmer_email:
         #     await send_anomaly_alert(
         #         farmer_email=farmer_email,
-        #         cow_id=state['cow_id'],
+        #         cow_id=state.cow_id,
         #         score=anomaly_score,
         #         avg_temp=avg_temp,
         #         time=last_timestamp
         #     )
-        print(f"(SESSION END) Cow {state['cow_id']} finished. Anomaly: {is_anomaly}")
+        logger.info("(SESSION END) Cow %s finished. Anomaly: %s", state.cow_id, is_anomaly)
 
 async def start_new_session(
     pool: asyncpg.Pool, 
@@ -201,125 +440,169 @@ async def start_new_session(
     temp: float,
     timestamp: datetime
 ):
-    cow_id = None
-    async with pool.acquire() as db:
-        cow_id = await get_active_cow_by_rfid(db, rfid_id)
+    hit, cow_id = get_cached_cow_by_rfid(rfid_id)
+    if not hit:
+        async with pool.acquire() as db:
+            cow_id = await get_active_cow_by_rfid(db, rfid_id)
     
     if not cow_id:
-        print(f"Ignoring session start for unassigned RFID: {rfid_id}")
+        logger.warning("Ignoring session start for unassigned RFID: %s", rfid_id)
         return
 
-    ACTIVE_SESSIONS[device_id] = {
-        "rfid_id": rfid_id,
-        "cow_id": cow_id,
-        "time_start": timestamp,
-        "weight_start": weight,
-        "last_weight": weight,
-        "last_seen": timestamp,
-        "last_consumption_time": timestamp,
-        "temp_sum": temp if temp else 0.0,
-        "temp_count": 1 if temp else 0
-    }
-    print(f"(SESSION START) Cow {cow_id} detected at {device_id}.")
+    state = SessionState(
+        rfid_id=rfid_id,
+        cow_id=cow_id,
+        time_start=timestamp,
+        weight_start=weight,
+        last_weight=weight,
+        last_seen=timestamp,
+        last_consumption_time=timestamp,
+        temp_mean=temp if temp else 0.0,
+        temp_count=1 if temp else 0
+    )
+    ACTIVE_SESSIONS[device_id] = state
+    heapq.heappush(
+        _session_deadlines,
+        (timestamp + SESSION_TIMEOUT, next(_deadline_seq), device_id, state)
+    )
+    logger.info("(SESSION START) Cow %s detected at %s.", cow_id, device_id)
 
 async def process_mqtt_message(pool: asyncpg.Pool, message: aiomqtt.Message):
-    global MQTT_DATA_BUFFER
-    
     try:
-        payload = json.loads(message.payload.decode())
+        # Parse bytes langsung, tanpa salinan str dari decode()
+        payload = _json_loads(message.payload)
         
         device_id = payload.get("id")
         if not device_id:
             return
 
-        client_timestamp_str = payload.get("ts")
-        timestamp_obj: datetime
-        if not client_timestamp_str:
-            timestamp_obj = datetime.now().astimezone()
-        else:
+        client_ts = payload.get("ts")
+        timestamp_obj: datetime | None = None
+        if isinstance(client_ts, (int, float)) and not isinstance(client_ts, bool):
+            # Jalur cepat: epoch milidetik dari firmware baru. Nilai di luar rentang
+            # wajar (0, negatif, NaN, RTC belum tersinkron) jatuh ke waktu server
+            if MIN_CLIENT_TS_MS <= client_ts <= MAX_CLIENT_TS_MS:
+                try:
+                    timestamp_obj = datetime.fromtimestamp(client_ts / 1000, tz=timezone.utc)
+                except (ValueError, OverflowError, OSError):
+                    pass
+        elif client_ts:
             try:
-                timestamp_obj = datetime.fromisoformat(client_timestamp_str)
+                timestamp_obj = datetime.fromisoformat(client_ts)
             except (ValueError, TypeError):
-                timestamp_obj = datetime.now().astimezone()
+                pass
+        if timestamp_obj is None:
+            # Satu-satunya titik fallback ke waktu server
+            timestamp_obj = datetime.now().astimezone()
         
         new_rfid = payload.get("rfid")
         new_weight = payload.get("w")
         new_temp = payload.get("temp")
         new_ip = payload.get("ip")
         
-        record_dict = {
-            "timestamp": timestamp_obj,
-            "device_id": device_id,
-            "rfid_id": new_rfid,
-            "weight": new_weight,
-            "temperature_c": new_temp,
-            "ip": new_ip
-        }
-        MQTT_DATA_BUFFER.append(record_dict)
+        if len(_ts_buf) == MAX_BUFFERED_ROWS:
+            _record_dropped(1) # append berikut menggeser baris tertua keluar
+        _ts_buf.append(timestamp_obj)
+        _dev_buf.append(device_id)
+        _rfid_buf.append(new_rfid)
+        _w_buf.append(new_weight)
+        _t_buf.append(new_temp)
+        _ip_buf.append(new_ip)
+        if len(_ts_buf) == 1 or len(_ts_buf) >= BUFFER_SIZE:
+            _flush_event.set()
 
         state = ACTIVE_SESSIONS.get(device_id)
-        current_rfid = state['rfid_id'] if state else None
+        current_rfid = state.rfid_id if state else None
         
         if new_rfid == current_rfid:
             if state:
-                weight_diff = state['last_weight'] - new_weight
+                weight_diff = state.last_weight - new_weight
                 
-                state['last_seen'] = timestamp_obj
+                state.last_seen = timestamp_obj
                 
                 if weight_diff > NOISE_THRESHOLD:
-                    state['last_consumption_time'] = timestamp_obj
+                    state.last_consumption_time = timestamp_obj
                     
-                state['last_weight'] = new_weight
+                state.last_weight = new_weight
                 if new_temp is not None:
-                    state['temp_sum'] += new_temp
-                    state['temp_count'] += 1
+                    state.temp_count += 1
+                    state.temp_mean += (new_temp - state.temp_mean) / state.temp_count
 
                 broadcast_message = {
-                    "cow_id": str(state['cow_id']),
+                    "cow_id": str(state.cow_id),
                     "timestamp": timestamp_obj.isoformat(),
                     "weight": new_weight,
                     "temperature_c": new_temp,
                     "device_id": device_id,
                     "event": "sensor_update"
                 }
-                await streaming_broker.broadcast(state['cow_id'], broadcast_message)
+                # Dikumpulkan dan dikirim per batch oleh broadcast_flusher_task
+                _broadcast_queues.setdefault(state.cow_id, []).append(broadcast_message)
         else:
             if state:
-                await finalize_session(pool, device_id, state['last_weight'], state['last_seen'])
+                await finalize_session(pool, device_id, state.last_weight, state.last_seen)
             
             if new_rfid and new_weight is not None and new_weight > WEIGHT_START_THRESHOLD:
                 await start_new_session(pool, device_id, new_rfid, new_weight, new_temp, timestamp_obj)
                 
+    except JSONDecodeError as e:
+        logger.error("Invalid JSON in MQTT message: %s | Topic: %s, Payload(raw): %r", e, message.topic, message.payload)
     except Exception as e:
-        print(f"Error processing MQTT message: {e}")
-        print(f"Topic: {str(message.topic)}, Payload: {message.payload.decode()}")
+        # repr() pada bytes: tanpa decode ulang yang bisa gagal di dalam except
+        logger.error("Error processing MQTT message: %s | Topic: %s, Payload(raw): %r", e, message.topic, message.payload)
 
 async def check_session_timeouts(pool: asyncpg.Pool):
     now = datetime.now().astimezone() 
-    timeout_threshold = timedelta(seconds=SESSION_TIMEOUT_SECONDS)
+    cutoff = now - SESSION_TIMEOUT
     
-    for device_id in list(ACTIVE_SESSIONS.keys()):
-        state = ACTIVE_SESSIONS.get(device_id)
-        if not state: 
+    # Hanya pop entri yang deadline-nya lewat, tanpa await: ACTIVE_SESSIONS tidak berubah di sini
+    expired = []
+    while _session_deadlines and _session_deadlines[0][0] < now:
+        _, _, device_id, state = heapq.heappop(_session_deadlines)
+        if ACTIVE_SESSIONS.get(device_id) is not state:
+            continue # Sesi sudah selesai atau diganti sesi baru
+        if state.last_consumption_time < cutoff:
+            expired.append((device_id, state))
+        else:
+            # Masih ada konsumsi sejak entri dibuat; jadwalkan ulang dengan deadline aktual
+            heapq.heappush(
+                _session_deadlines,
+                (state.last_consumption_time + SESSION_TIMEOUT, next(_deadline_seq), device_id, state)
+            )
+
+    for device_id, state in expired:
+        # Di antara await, listener bisa sudah menutup sesi ini atau membuka sesi baru
+        if ACTIVE_SESSIONS.get(device_id) is not state:
             continue
-            
-        if now - state['last_consumption_time'] > timeout_threshold:
-            print(f"Session for {device_id} timed out (consumption halt). Finalizing...")
-
-            timeout_msg = {
-                "cow_id": str(state['cow_id']), 
-                "event": "session_timeout",
-                "device_id": device_id,
-                "timestamp": state['last_seen'].isoformat()
-            }
-            await streaming_broker.broadcast(state['cow_id'], timeout_msg)
+
+        logger.info("Session for %s timed out (consumption halt). Finalizing...", device_id)
+
+        timeout_msg = {
+            "cow_id": str(state.cow_id), 
+            "event": "session_timeout",
+            "device_id": device_id,
+            "timestamp": state.last_seen.isoformat()
+        }
+        # Entri heap sesi ini sudah di-pop: error di satu sesi tidak boleh
+        # menghentikan loop, kalau tidak sesi sisanya tidak akan pernah timeout
+        try:
+            await flush_pending_broadcasts(state.cow_id)
+            await streaming_broker.broadcast(state.cow_id, timeout_msg)
             
             await finalize_session(
                 pool, 
                 device_id, 
-                state['last_weight'], 
-                state['last_seen']
+                state.last_weight, 
+                state.last_seen
             )
+        except Exception as e:
+            logger.error("Error finalizing timed-out session for %s: %s", device_id, e)
+            if ACTIVE_SESSIONS.get(device_id) is state:
+                # Gagal sebelum sesi dilepas: jadwalkan ulang agar dicoba pada tick berikutnya
+                heapq.heappush(
+                    _session_deadlines,
+                    (now, next(_deadline_seq), device_id, state)
+                )
 
 async def session_timeout_checker_task(pool: asyncpg.Pool):
     while True:
@@ -327,12 +610,165 @@ async def session_timeout_checker_task(pool: asyncpg.Pool):
         try:
             await check_session_timeouts(pool)
         except Exception as e:
-            print(f"Error in session timeout checker task: {e}")
+            logger.error("Error in session timeout checker task: %s", e)
+
+async def flush_pending_broadcasts(cow_id: UUID):
+    """Kirim sensor_update yang masih tertunda untuk satu sapi (sebelum event sesi)."""
+    messages = _broadcast_queues.pop(cow_id, None)
+    if messages:
+        await streaming_broker.broadcast_batch(cow_id, messages)
+
+async def broadcast_flusher_task():
+    """Mengirim sensor_update yang terkumpul per sapi setiap BROADCAST_INTERVAL."""
+    global _broadcast_queues
+    while True:
+        await asyncio.sleep(BROADCAST_INTERVAL)
+        if not _broadcast_queues:
+            continue
+        pending, _broadcast_queues = _broadcast_queues, {}
+        for cow_id, messages in pending.items():
+            try:
+                await streaming_broker.broadcast_batch(cow_id, messages)
+            except Exception as e:
+                logger.error("Error in broadcast flusher task: %s", e)
+
+def _record_dropped_anomaly_scores(dropped: int, reason: str):
+    global _dropped_anomaly_scores
+    _dropped_anomaly_scores += dropped
+    logger.warning(
+        "Dropped %s anomaly scores (%s; total dropped: %s)",
+        dropped, reason, _dropped_anomaly_scores
+    )
+
+def _buffer_anomaly_scores(rows, front: bool = False):
+    """
+    Tambahkan skor ke _ANOMALY_BUFFER (di depan bila front, untuk retry).
+    Bila melebihi MAX_ANOMALY_BUFFER, skor tertua yang dibuang.
+    """
+    global _ANOMALY_BUFFER
+    rows = list(rows)
+    dropped = len(_ANOMALY_BUFFER) + len(rows) - MAX_ANOMALY_BUFFER
+    if front:
+        _ANOMALY_BUFFER = deque(chain(rows, _ANOMALY_BUFFER), maxlen=MAX_ANOMALY_BUFFER)
+    else:
+        _ANOMALY_BUFFER.extend(rows)
+    if dropped > 0:
+        _record_dropped_anomaly_scores(dropped, "buffer full")
+
+def _is_connection_error(e: Exception) -> bool:
+    """Error koneksi/server (layak di-retry), bukan error karena isi baris."""
+    return isinstance(e, (
+        OSError,
+        asyncio.TimeoutError,
+        asyncpg.InterfaceError,
+        asyncpg.exceptions.PostgresConnectionError,
+        asyncpg.exceptions.OperatorInterventionError,
+        asyncpg.exceptions.InsufficientResourcesError,
+    ))
+
+async def _save_anomaly_rows_individually(db: asyncpg.Connection, pending: deque):
+    """
+    executemany membatalkan seluruh batch bila satu baris gagal (mis. sesi sudah
+    dihapus). Simpan per baris agar hanya baris buruk yang dibuang. Error koneksi
+    diteruskan; baris yang belum diproses tetap di pending.
+    """
+    while pending:
+        try:
+            await crud_ml.save_anomaly_scores(db, [pending[0]])
+        except Exception as e:
+            if _is_connection_error(e):
+                raise
+            _record_dropped_anomaly_scores(1, f"session {pending[0][1]}: {e}")
+        pending.popleft()
+
+async def flush_anomaly_buffer(pool: asyncpg.Pool):
+    """Simpan semua skor anomali yang terkumpul dari finalize_session dalam satu batch."""
+    global _anomaly_flush_failures
+    if not _ANOMALY_BUFFER:
+        return
+
+    pending = deque(_ANOMALY_BUFFER)
+    _ANOMALY_BUFFER.clear()
+    try:
+        async with pool.acquire() as db:
+            try:
+                await crud_ml.save_anomaly_scores(db, list(pending))
+                pending.clear()
+            except Exception as e:
+                if _is_connection_error(e):
+                    raise
+                await _save_anomaly_rows_individually(db, pending)
+        _anomaly_flush_failures = 0
+    except Exception as e:
+        # Koneksi bermasalah: coba lagi pada flush berikutnya, dengan batas retry
+        _anomaly_flush_failures += 1
+        if _anomaly_flush_failures >= MAX_ANOMALY_FLUSH_RETRIES:
+            _record_dropped_anomaly_scores(
+                len(pending), f"{_anomaly_flush_failures} failed flushes, last error: {e}"
+            )
+            _anomaly_flush_failures = 0
+        else:
+            _buffer_anomaly_scores(pending, front=True)
+
+async def buffer_flush_task(pool: asyncpg.Pool):
+    """
+    Flush buffer saat mencapai BUFFER_SIZE baris atau saat baris tertua sudah
+    menunggu BUFFER_MAX_LATENCY detik, mana yang lebih dulu. process_mqtt_message
+    men-set _flush_event saat buffer mulai terisi (untuk memulai tenggat) dan saat
+    penuh. Skor anomali dari finalize_session juga ditulis di sini.
+    """
+    batch_started: float | None = None # Waktu (monotonic) buffer mulai terisi
+    while True:
+        if batch_started is None:
+            timeout = BUFFER_MAX_LATENCY
+        else:
+            timeout = max(0.0, batch_started + BUFFER_MAX_LATENCY - time.monotonic())
+        try:
+            await asyncio.wait_for(_flush_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        _flush_event.clear()
+
+        if _ts_buf:
+            now = time.monotonic()
+            if batch_started is None:
+                batch_started = now
+            if len(_ts_buf) >= BUFFER_SIZE or now - batch_started >= BUFFER_MAX_LATENCY:
+                if schedule_flush(pool):
+                    batch_started = None
+                else:
+                    # Semua slot flush terpakai: tunggu satu selesai sebelum mencoba lagi
+                    await asyncio.wait(set(_flush_tasks), return_when=asyncio.FIRST_COMPLETED)
+        else:
+            batch_started = None
+        await flush_anomaly_buffer(pool)
+
+async def warm_rfid_cache(pool: asyncpg.Pool):
+    """Isi _recent_rfids dari rfid_tag agar flush pertama tidak meng-upsert RFID lama."""
+    try:
+        async with pool.acquire() as db:
+            rfid_ids = await get_recent_rfid_ids(db, RECENT_RFID_CACHE_SIZE)
+    except Exception as e:
+        logger.error("Failed to warm RFID cache: %s", e)
+        return
+    for rfid_id in rfid_ids:
+        _recent_rfids[rfid_id] = None
+    logger.info("RFID cache warmed with %s tags.", len(rfid_ids))
 
 async def mqtt_listener_task(pool: asyncpg.Pool):
-    subscription_topic = f"{settings.MQTT_TOPIC_PREFIX}"
-    print(f"Connecting to MQTT Broker at {settings.MQTT_BROKER_HOST}...")
-    last_flush_time = asyncio.get_event_loop().time()
+    """
+    Loop utama MQTT. Listener sendiri tidak memegang koneksi pool; koneksi
+    hanya dipinjam singkat oleh flush background (maks. FLUSH_CONCURRENCY),
+    start_new_session (saat cache RFID miss) dan finalize_session (satu acquire).
+    """
+    subscription_topic = SUBSCRIPTION_TOPIC
+    await warm_rfid_cache(pool)
+    try:
+        async with pool.acquire() as db:
+            await prune_model_cache(db)
+    except Exception as e:
+        logger.error("Failed to prune model cache: %s", e)
+    logger.info("Connecting to MQTT Broker at %s...", settings.MQTT_BROKER_HOST)
 
     while True:
         try:
@@ -340,23 +776,17 @@ async def mqtt_listener_task(pool: asyncpg.Pool):
                 hostname=settings.MQTT_BROKER_HOST, 
                 port=settings.MQTT_BROKER_PORT
             ) as client:
-                print(f"MQTT Client connected. Subscribing to '{subscription_topic}'")
+                logger.info("MQTT Client connected. Subscribing to '%s'", subscription_topic)
                 await client.subscribe(subscription_topic)
                 
                 async for message in client.messages:
+                    # Flush (ukuran maupun waktu) ditangani oleh buffer_flush_task
                     await process_mqtt_message(pool, message)
                     
-                    current_time = asyncio.get_event_loop().time()
-                    if (len(MQTT_DATA_BUFFER) >= BUFFER_SIZE or 
-                        current_time - last_flush_time >= BUFFER_TIMEOUT):
-                        
-                        await flush_buffer_to_db(pool)
-                        last_flush_time = current_time
-                    
         except aiomqtt.MqttError as e:
-            print(f"MQTT connection error, reconnecting in 5 seconds... Error: {e}")
-            await flush_buffer_to_db(pool)
+            logger.error("MQTT connection error, reconnecting in 5 seconds... Error: %s", e)
+            await drain_pending_flushes(pool)
             await asyncio.sleep(5)
         except Exception as e:
-            print(f"An unexpected error occurred in MQTT task, restarting... Error: {e}")
+            logger.error("An unexpected error occurred in MQTT task, restarting... Error: %s", e)
             await asyncio.sleep(5)
\ No newline at end of file
@@ -1,6 +1,5 @@
 # schemas/sensor.py
 from pydantic import BaseModel
-from pydantic.networks import IPvAnyAddress
 from datetime import datetime
 from uuid import UUID
 
@@ -13,7 +12,7 @@ class SensorDataPoint(BaseModel):
     rfid_id: str
     weight: float | None = None
     temperature_c: float | None = None
-    ip: IPvAnyAddress | None = None
+    ip: str | None = None # Sudah berupa teks dari DB (host(ip)), tanpa parsing ulang
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
@@ -2,7 +2,6 @@
 import asyncpg
 from uuid import UUID
 from schemas.cow import CowCreate, CowUpdate
-import json
 
 async def create_cow(
     db: asyncpg.Connection, 
@@ -38,8 +37,8 @@ async def get_cows_by_farmer(
     SELECT 
         c.*, 
         COALESCE(
-            json_agg(cp.*) FILTER (WHERE cp.pregnancy_id IS NOT NULL), 
-            '[]'::json
+            jsonb_agg(cp.*) FILTER (WHERE cp.pregnancy_id IS NOT NULL), 
+            '[]'::jsonb
         ) as pregnancies
     FROM cow c
     LEFT JOIN cow_pregnancy cp ON c.cow_id = cp.cow_id
@@ -49,16 +48,8 @@ async def get_cows_by_farmer(
     """
     cows = await db.fetch(query, farmer_id)
     
-    # --- 2. Lakukan perulangan dan parsing ---
-    results = []
-    for cow_record in cows:
-        cow_dict = dict(cow_record)
-        # 'pregnancies' saat ini adalah string (misal: '[{...}]' atau '[]')
-        # Kita ubah menjadi list Python
-        cow_dict['pregnancies'] = json.loads(cow_dict['pregnancies'])
-        results.append(cow_dict)
-        
-    return results
+    # 'pregnancies' sudah berupa list Python (codec JSONB di db/postgresql.py)
+    return [dict(cow_record) for cow_record in cows]
 
 async def get_cow_by_id(
     db: asyncpg.Connection, 
@@ -72,8 +63,8 @@ async def get_cow_by_id(
     SELECT 
         c.*, 
         COALESCE(
-            json_agg(cp.*) FILTER (WHERE cp.pregnancy_id IS NOT NULL), 
-            '[]'::json
+            jsonb_agg(cp.*) FILTER (WHERE cp.pregnancy_id IS NOT NULL), 
+            '[]'::jsonb
         ) as pregnancies
     FROM cow c
     LEFT JOIN cow_pregnancy cp ON c.cow_id = cp.cow_id
@@ -85,12 +76,8 @@ async def get_cow_by_id(
     if not cow:
         return None
         
-    # --- 3. Ubah record dan parsing ---
-    cow_dict = dict(cow)
-    # 'pregnancies' saat ini adalah string, ubah menjadi list
-    cow_dict['pregnancies'] = json.loads(cow_dict['pregnancies'])
-    
-    return cow_dict
+    # 'pregnancies' sudah berupa list Python (codec JSONB)
+    return dict(cow)
 
 async def update_cow(
     db: asyncpg.Connection, 
@@ -1,19 +1,26 @@
 # services/crud_device.py
 import asyncpg
+import logging
 from typing import List, Tuple
 
+logger = logging.getLogger(__name__)
+
 async def upsert_device_status(db: asyncpg.Connection, device_data_batch: List[Tuple]):
+    # Satu statement untuk seluruh batch via UNNEST; device_id dalam batch harus unik
     query = """
     INSERT INTO device (device_id, status, last_ip, last_seen)
-    VALUES ($1, 'ONLINE', $2, $3)
+    SELECT u.device_id, 'ONLINE', u.last_ip, u.last_seen
+    FROM UNNEST($1::varchar[], $2::varchar[], $3::timestamptz[]) AS u(device_id, last_ip, last_seen)
     ON CONFLICT (device_id) DO UPDATE 
     SET 
         status = 'ONLINE',
-        last_ip = $2,
-        last_seen = $3;
+        last_ip = EXCLUDED.last_ip,
+        last_seen = EXCLUDED.last_seen;
     """
+    device_ids, last_ips, last_seens = zip(*device_data_batch)
     try:
-        await db.executemany(query, device_data_batch)
-        print(f"(DEVICE MONITOR) Updated status for {len(device_data_batch)} devices.")
+        await db.execute(query, list(device_ids), list(last_ips), list(last_seens))
+        logger.info("(DEVICE MONITOR) Updated status for %s devices.", len(device_data_batch))
     except Exception as e:
-        print(f"Error during device UPSERT: {e}")
\ No newline at end of file
+        logger.error("Error during device UPSERT: %s", e)
+        raise
\ No newline at end of file
@@ -1,9 +1,11 @@
 # services/crud_ml.py
 import asyncpg
-import json 
+import logging
 from uuid import UUID
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 async def get_sessions_for_training(
     db: asyncpg.Connection, 
     cow_id: UUID, 
@@ -53,11 +55,11 @@ async def save_new_model(
                 )
                 VALUES ($1, $2, $3, $4, $5, $6, true);
                 """,
-                cow_id, model_version, model_data, start_date, end_date, json.dumps(metrics)
+                cow_id, model_version, model_data, start_date, end_date, metrics
             )
-        print(f"(ML Training) Model baru {model_version} untuk Sapi {cow_id} berhasil disimpan dan diaktifkan.")
+        logger.info("(ML Training) Model baru %s untuk Sapi %s berhasil disimpan dan diaktifkan.", model_version, cow_id)
     except Exception as e:
-        print(f"Error saving new model: {e}")
+        logger.error("Error saving new model: %s", e)
 
 async def get_active_model_for_cow(db: asyncpg.Connection, cow_id: UUID) -> asyncpg.Record | None:
     """
@@ -74,18 +76,58 @@ async def get_active_model_for_cow(db: asyncpg.Connection, cow_id: UUID) -> asyn
     model = await db.fetchrow(query)
     return model
 
-async def get_unscored_sessions(db: asyncpg.Connection) -> list[asyncpg.Record]:
+async def get_active_model_id_for_cow(db: asyncpg.Connection, cow_id: UUID) -> UUID | None:
+    """
+    Sama seperti get_active_model_for_cow, tetapi hanya mengambil model_id
+    (tanpa BYTEA model_data) dalam satu query.
     """
-    Mengambil semua sesi makan yang belum ada di tabel 'anomaly'.
+    query = """
+    SELECT model_id FROM machine_learning_model
+    WHERE (cow_id = $1 OR cow_id IS NULL) AND is_active = true
+    ORDER BY cow_id NULLS LAST
+    LIMIT 1;
     """
+    return await db.fetchval(query, cow_id)
+
+async def get_active_model_ids(db: asyncpg.Connection) -> set[UUID]:
+    """Semua model_id yang masih aktif (per-sapi maupun UMUM)."""
+    records = await db.fetch("SELECT model_id FROM machine_learning_model WHERE is_active = true")
+    return {record['model_id'] for record in records}
+
+async def get_model_data(db: asyncpg.Connection, model_id: UUID) -> bytes | None:
+    """Mengambil blob model hasil joblib untuk satu model_id."""
+    query = "SELECT model_data FROM machine_learning_model WHERE model_id = $1"
+    return await db.fetchval(query, model_id)
+
+async def get_unscored_sessions(
+    db: asyncpg.Connection,
+    limit: int = 10000,
+    after: tuple[datetime, UUID] | None = None
+) -> list[asyncpg.Record]:
+    """
+    Mengambil sesi makan yang belum ada di tabel 'anomaly', maksimal 'limit' baris.
+    'after' adalah kursor (time_start, session_id) dari baris terakhir chunk
+    sebelumnya, agar sesi yang dilewati (misal: tanpa model) tidak diambil ulang.
+    """
+    if after is None:
+        query = """
+        SELECT es.* FROM eat_session es
+        LEFT JOIN anomaly a ON es.session_id = a.session_id
+        WHERE a.session_id IS NULL
+        ORDER BY es.time_start, es.session_id
+        LIMIT $1;
+        """
+        return await db.fetch(query, limit)
+
     query = """
     SELECT es.* FROM eat_session es
     LEFT JOIN anomaly a ON es.session_id = a.session_id
     WHERE a.session_id IS NULL
-    ORDER BY es.time_start
-    LIMIT 1000; 
+    AND (es.time_start, es.session_id) > ($2, $3)
+    ORDER BY es.time_start, es.session_id
+    LIMIT $1;
     """
-    return await db.fetch(query)
+    return await db.fetch(query, limit, after[0], after[1])
 
 async def save_anomaly_scores(db: asyncpg.Connection, anomaly_data: list[tuple]):
     """
@@ -98,6 +140,7 @@ async def save_anomaly_scores(db: asyncpg.Connection, anomaly_data: list[tuple])
     """
     try:
         await db.executemany(query, anomaly_data)
-        print(f"(ML Prediction) Berhasil menyimpan {len(anomaly_data)} skor anomali.")
+        logger.info("(ML Prediction) Berhasil menyimpan %s skor anomali.", len(anomaly_data))
     except Exception as e:
-        print(f"Error saving anomaly scores: {e}")
\ No newline at end of file
+        logger.error("Error saving anomaly scores: %s", e)
+        raise
\ No newline at end of file
@@ -1,19 +1,33 @@
 # services/crud_rfid.py
 import asyncpg
+import logging
 from uuid import UUID
 from typing import List, Tuple
 
+from services.crud_session import invalidate_rfid_cache
+
+logger = logging.getLogger(__name__)
+
 async def upsert_rfid_tags(db: asyncpg.Connection, rfid_batch: List[Tuple]):
     query = """
     INSERT INTO rfid_tag (rfid_id, created_at)
-    VALUES ($1, NOW())
+    SELECT rfid_id, NOW() FROM UNNEST($1::varchar[]) AS u(rfid_id)
     ON CONFLICT (rfid_id) DO NOTHING;
     """
     try:
-        await db.executemany(query, rfid_batch)
-        print(f"(RFID REGISTER) Processed {len(rfid_batch)} RFID tags.")
+        await db.execute(query, [row[0] for row in rfid_batch])
+        logger.info("(RFID REGISTER) Processed %s RFID tags.", len(rfid_batch))
     except Exception as e:
-        print(f"Error during RFID tag UPSERT: {e}")
+        logger.error("Error during RFID tag UPSERT: %s", e)
+        raise
+
+async def get_recent_rfid_ids(db: asyncpg.Connection, limit: int) -> List[str]:
+    """RFID terdaftar terbaru (paling baru di akhir), untuk mengisi cache saat startup."""
+    rows = await db.fetch(
+        "SELECT rfid_id FROM rfid_tag ORDER BY created_at DESC LIMIT $1",
+        limit
+    )
+    return [row['rfid_id'] for row in reversed(rows)]
 
 
 async def assign_rfid_to_cow(
@@ -22,29 +36,28 @@ async def assign_rfid_to_cow(
     cow_id: UUID
 ) -> asyncpg.Record | None:
     try:
-        async with db.transaction():
-            await db.execute(
-                """
+        # Tutup kepemilikan lama dan buka yang baru dalam satu statement (atomik).
+        # Kedua bagian memakai snapshot yang sama, jadi UPDATE tidak menyentuh baris baru.
+        new_assignment = await db.fetchrow(
+            """
+            WITH closed AS (
                 UPDATE rfid_ownership
                 SET time_end = NOW()
-                WHERE rfid_id = $1 AND time_end IS NULL;
-                """,
-                rfid_id
-            )
-            new_assignment = await db.fetchrow(
-                """
-                INSERT INTO rfid_ownership (rfid_id, time_start, cow_id, time_end)
-                VALUES ($1, NOW(), $2, NULL)
-                RETURNING *;
-                """,
-                rfid_id,
-                cow_id
+                WHERE rfid_id = $1 AND time_end IS NULL
             )
-            return dict(new_assignment)
+            INSERT INTO rfid_ownership (rfid_id, time_start, cow_id, time_end)
+            VALUES ($1, NOW(), $2, NULL)
+            RETURNING *;
+            """,
+            rfid_id,
+            cow_id
+        )
+        invalidate_rfid_cache(rfid_id)
+        return dict(new_assignment)
     except asyncpg.exceptions.ForeignKeyViolationError as e:
         # Ini akan error jika rfid_id atau cow_id tidak ada
-        print(f"Error: Foreign key violation. {e}")
+        logger.error("Error: Foreign key violation. %s", e)
         return None
     except Exception as e:
-        print(f"Error during RFID assignment transaction: {e}")
+        logger.error("Error during RFID assignment transaction: %s", e)
         return None
\ No newline at end of file
@@ -1,11 +1,24 @@
 # services/crud_sensor.py
 import asyncpg
+import logging
 from typing import List, Tuple
 from uuid import UUID
 from datetime import datetime
 
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
 
 async def batch_insert_sensor_data(db: asyncpg.Connection, data_batch: List[Tuple]):
+    """
+    Menyimpan batch output_sensor. Memakai COPY biner (copy_sensor_data)
+    kecuali SENSOR_INSERT_USE_COPY dimatikan, baru jatuh ke executemany.
+    """
+    if settings.SENSOR_INSERT_USE_COPY:
+        await copy_sensor_data(db, data_batch)
+        return
+
     query = """
     INSERT INTO output_sensor ("timestamp", device_id, rfid_id, weight, temperature_c, ip)
     VALUES ($1, $2, $3, $4, $5, $6);
@@ -13,27 +26,50 @@ async def batch_insert_sensor_data(db: asyncpg.Connection, data_batch: List[Tupl
     
     try:
         await db.executemany(query, data_batch)
-        print(f"(BATCH INSERT) Successfully inserted {len(data_batch)} records.")
+        logger.info("(BATCH INSERT) Successfully inserted %s records.", len(data_batch))
+    except Exception as e:
+        logger.error("Error during batch insert: %s", e)
+        raise
+
+SENSOR_COLUMNS = ["timestamp", "device_id", "rfid_id", "weight", "temperature_c", "ip"]
+
+async def copy_sensor_data(db: asyncpg.Connection, data_batch: List[Tuple]):
+    """
+    Insert batch output_sensor lewat protokol COPY biner.
+    output_sensor tidak punya trigger/rule/default yang butuh semantik INSERT.
+    """
+    try:
+        await db.copy_records_to_table(
+            "output_sensor",
+            records=data_batch,
+            columns=SENSOR_COLUMNS,
+            timeout=10
+        )
+        logger.info("(BATCH COPY) Successfully copied %s records.", len(data_batch))
     except Exception as e:
-        print(f"Error during batch insert: {e}")
+        logger.error("Error during batch copy: %s", e)
+        raise
 
 async def get_sensor_history(
     db: asyncpg.Connection, 
     cow_id: UUID,
     start_time: datetime,
     end_time: datetime
-) -> List[dict]:
+) -> str:
     """
-    Mengambil data sensor mentah untuk satu Sapi dalam rentang waktu.
+    Mengambil data sensor mentah untuk satu Sapi dalam rentang waktu,
+    langsung sebagai teks array JSON yang dibangun PostgreSQL (json_agg).
     
     Query ini melakukan JOIN untuk menemukan semua RFID yang
     PERNAH ditugaskan ke sapi ini, lalu mengambil data sensor
     selama RFID itu aktif.
     """
     query = """
+    SELECT COALESCE(json_agg(h ORDER BY h."timestamp" DESC), '[]'::json)::text
+    FROM (
     SELECT 
         t1."timestamp", t1.device_id, t1.rfid_id, 
-        t1.weight, t1.temperature_c, t1.ip
+        t1.weight, t1.temperature_c, host(t1.ip) AS ip
     FROM output_sensor AS t1
     INNER JOIN rfid_ownership AS t2
         -- 1. Gabungkan berdasarkan rfid_id
@@ -47,13 +83,13 @@ async def get_sensor_history(
         -- 4. Filter berdasarkan rentang waktu yang diminta
         t1."timestamp" BETWEEN $2 AND $3
     ORDER BY t1."timestamp" DESC
-    LIMIT 1000; -- Batasi agar tidak overload (opsional tapi disarankan)
+    LIMIT 1000 -- Batasi agar tidak overload (opsional tapi disarankan)
+    ) AS h;
     """
     
     try:
-        records = await db.fetch(query, cow_id, start_time, end_time)
-        # Konversi asyncpg.Record menjadi dict
-        return [dict(record) for record in records]
+        # Satu nilai teks; tidak ada objek per baris di sisi Python
+        return await db.fetchval(query, cow_id, start_time, end_time)
     except Exception as e:
-        print(f"Error getting sensor history: {e}")
-        return []
\ No newline at end of file
+        logger.error("Error getting sensor history: %s", e)
+        return "[]"
\ No newline at end of file
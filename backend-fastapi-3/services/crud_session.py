@@ -1,15 +1,45 @@
 # services/crud_session.py
 import asyncpg
+import logging
+import time
 from uuid import UUID
 from datetime import datetime, timedelta, date
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cache RFID -> cow_id (termasuk hasil negatif), berlaku selama _RFID_CACHE_TTL detik
+_RFID_COW_CACHE: Dict[str, Tuple[Optional[UUID], float]] = {}
+_RFID_CACHE_TTL = 60.0
+_RFID_CACHE_MAX_SIZE = 50_000 # Entri disimpan urut kedaluwarsa; yang paling lama dibuang saat penuh
+
+def get_cached_cow_by_rfid(rfid_id: str) -> Tuple[bool, UUID | None]:
+    """Mengembalikan (hit, cow_id) dari cache tanpa menyentuh database."""
+    entry = _RFID_COW_CACHE.get(rfid_id)
+    if entry is None:
+        return False, None
+    cow_id, expires_at = entry
+    if time.monotonic() >= expires_at:
+        del _RFID_COW_CACHE[rfid_id]
+        return False, None
+    return True, cow_id
+
+def invalidate_rfid_cache(rfid_id: str):
+    """Dipanggil setiap kali kepemilikan RFID berubah."""
+    _RFID_COW_CACHE.pop(rfid_id, None)
 
 async def get_active_cow_by_rfid(db: asyncpg.Connection, rfid_id: str) -> UUID | None:
     if not rfid_id:
         return None
     query = "SELECT cow_id FROM rfid_ownership WHERE rfid_id = $1 AND time_end IS NULL;"
     record = await db.fetchrow(query, rfid_id)
-    return record['cow_id'] if record else None
+    cow_id = record['cow_id'] if record else None
+    # pop lalu insert ulang agar urutan dict tetap urut waktu kedaluwarsa
+    _RFID_COW_CACHE.pop(rfid_id, None)
+    if len(_RFID_COW_CACHE) >= _RFID_CACHE_MAX_SIZE:
+        del _RFID_COW_CACHE[next(iter(_RFID_COW_CACHE))]
+    _RFID_COW_CACHE[rfid_id] = (cow_id, time.monotonic() + _RFID_CACHE_TTL)
+    return cow_id
 
 async def create_eat_session(
     db: asyncpg.Connection,
@@ -23,7 +53,7 @@ async def create_eat_session(
     average_temp: float
 ):
     if weight_end >= weight_start:
-        print(f"(SESSION CANCELED) Sesi {device_id} dibatalkan (berat tidak berkurang).")
+        logger.info("(SESSION CANCELED) Sesi %s dibatalkan (berat tidak berkurang).", device_id)
         return None
 
     query = """
@@ -44,10 +74,10 @@ async def create_eat_session(
             weight_start, weight_end,
             average_temp
         )
-        print(f"(SESSION CREATED) Cow {cow_id} at {device_id} finished. Avg Temp: {average_temp:.2f}")
+        logger.info("(SESSION CREATED) Cow %s at %s finished. Avg Temp: %.2f", cow_id, device_id, average_temp)
         return session_id
     except Exception as e:
-        print(f"Error creating eat_session: {e}")
+        logger.error("Error creating eat_session: %s", e)
 
 async def get_eating_sessions(
     conn: asyncpg.Connection,
@@ -56,7 +86,10 @@ async def get_eating_sessions(
     end_date: Optional[datetime] = None
 ) -> List[dict]:
     """Get eating sessions for a cow from view"""
+    # Baris digabung PostgreSQL (json_agg) dan di-decode sekali oleh codec JSON pool
     query = """
+        SELECT COALESCE(json_agg(s ORDER BY s.timestamp DESC), '[]'::json)
+        FROM (
         SELECT 
             session_id,
             timestamp,
@@ -78,10 +111,9 @@ async def get_eating_sessions(
         query += f" AND timestamp <= ${len(params) + 1}"
         params.append(end_date)
     
-    query += " ORDER BY timestamp DESC"
+    query += ") AS s"
     
-    rows = await conn.fetch(query, *params)
-    return [dict(row) for row in rows]
+    return await conn.fetchval(query, *params)
 
 async def get_daily_summary(
     conn: asyncpg.Connection,
@@ -130,19 +162,19 @@ async def get_weekly_summary(
     rows = await conn.fetch(query, cow_id, weeks)
     return [dict(row) for row in rows]
 
-async def get_sessions_for_date(
+async def get_sessions_grouped_by_date(
     conn: asyncpg.Connection,
     cow_id: UUID,
-    date_str: str # Renamed parameter for clarity
-) -> List[dict]:
-    """Get all sessions for a specific date"""    
-    try:
-        query_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        print(f"Invalid date format received: {date_str}")
-        return []
-
+    start_date: date,
+    end_date: date
+) -> Dict[date, list]:
+    """
+    Sesi makan per tanggal untuk rentang [start_date, end_date] dalam satu query
+    (bukan satu query per hari). Tanggal tanpa sesi tidak muncul di hasil.
+    """
     query = """
+        SELECT DATE(s.timestamp) AS date, json_agg(s ORDER BY s.timestamp ASC) AS sessions
+        FROM (
         SELECT 
             session_id,
             timestamp,
@@ -153,8 +185,10 @@ async def get_sessions_for_date(
             is_anomaly
         FROM eating_session_detail
         WHERE cow_id = $1
-        AND DATE(timestamp) = $2 
-        ORDER BY timestamp ASC
+        AND timestamp >= $2::date
+        AND timestamp < $3::date + 1
+        ) AS s
+        GROUP BY DATE(s.timestamp)
     """
-    rows = await conn.fetch(query, cow_id, query_date) 
-    return [dict(row) for row in rows]
\ No newline at end of file
+    rows = await conn.fetch(query, cow_id, start_date, end_date)
+    return {row['date']: row['sessions'] for row in rows}
@@ -5,29 +5,23 @@ from email.header import Header
 from core.config import settings
 from uuid import UUID
 import asyncio
+import logging
+import threading
+import time as _time
 from datetime import datetime
-import smtplib
 
-async def send_anomaly_alert(
-    farmer_email: str, 
-    cow_id: UUID, 
-    score: float, 
-    avg_temp: float,
-    time: datetime
-):
-    """
-    Mengirim email peringatan anomali menggunakan background thread.
-    """
-    
-    subject = f"🚨 ANOMALI KRITIS TERDETEKSI: Sapi {cow_id} ({avg_temp:.2f}°C)"
-    body = f"""
+logger = logging.getLogger(__name__)
+
+# Template dibangun sekali saat import; tiap alert hanya mengisi nilainya
+ANOMALY_SUBJECT_TEMPLATE = "🚨 ANOMALI KRITIS TERDETEKSI: Sapi {cow_id} ({avg_temp:.2f}°C)"
+ANOMALY_BODY_TEMPLATE = """
     Halo Farmer,
     
     Sistem deteksi anomali telah mengidentifikasi perilaku makan yang sangat tidak biasa pada sapi Anda.
     
     DETAIL ANOMALI:
     - Sapi ID: {cow_id}
-    - Waktu Kejadian: {time.strftime('%Y-%m-%d %H:%M:%S %Z')}
+    - Waktu Kejadian: {time}
     - Suhu Rata-rata Sesi: {avg_temp:.2f}°C
     - Skor Anomali (iForest): {score:.4f} (Semakin tinggi/dekat 0, semakin anomali)
     
@@ -36,6 +30,25 @@ async def send_anomaly_alert(
     Terima kasih,
     Sistem Monitoring Sapi
     """
+
+async def send_anomaly_alert(
+    farmer_email: str, 
+    cow_id: UUID, 
+    score: float, 
+    avg_temp: float,
+    time: datetime
+):
+    """
+    Mengirim email peringatan anomali menggunakan background thread.
+    """
+    
+    subject = ANOMALY_SUBJECT_TEMPLATE.format(cow_id=cow_id, avg_temp=avg_temp)
+    body = ANOMALY_BODY_TEMPLATE.format_map({
+        "cow_id": cow_id,
+        "time": time.strftime('%Y-%m-%d %H:%M:%S %Z'),
+        "avg_temp": avg_temp,
+        "score": score,
+    })
     
     msg = MIMEText(body, 'plain', 'utf-8')
     msg['Subject'] = Header(subject, 'utf-8')
@@ -44,18 +57,79 @@ async def send_anomaly_alert(
 
     # Membungkus pemanggilan SMTPLIB yang blocking ke dalam asyncio.to_thread
     await asyncio.to_thread(_send_mail_blocking, msg, farmer_email)
-    print(f"(EMAIL ALERT) Dikirim ke {farmer_email} untuk Sapi {cow_id}.")
+    logger.info("(EMAIL ALERT) Dikirim ke %s untuk Sapi %s.", farmer_email, cow_id)
+
+class SMTPPool:
+    """
+    Satu koneksi SMTP (TLS + login) yang dipakai ulang antar email, agar
+    alert beruntun tidak membayar handshake TLS dan LOGIN setiap kali.
+    Dipakai dari thread (asyncio.to_thread), jadi akses dijaga threading.Lock.
+    """
+    IDLE_CHECK_SECONDS = 30.0 # Koneksi yang lama menganggur dicek dulu dengan NOOP
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._server: smtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=10)
+        try:
+            server.starttls()
+            server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _get_server(self) -> smtplib.SMTP:
+        if self._server is not None and _time.monotonic() - self._last_used > self.IDLE_CHECK_SECONDS:
+            try:
+                if self._server.noop()[0] != 250:
+                    self._close()
+            except (smtplib.SMTPException, OSError): # Termasuk broken pipe / reset
+                self._close()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def send(self, recipient_email: str, message: str):
+        with self._lock:
+            try:
+                self._get_server().sendmail(settings.EMAIL_SENDER, recipient_email, message)
+            except smtplib.SMTPServerDisconnected:
+                # Server menutup koneksi di antara dua email: sambung ulang sekali
+                self._close()
+                try:
+                    self._get_server().sendmail(settings.EMAIL_SENDER, recipient_email, message)
+                except Exception:
+                    self._close() # Jangan simpan koneksi setengah terbuka di pool
+                    raise
+            except Exception:
+                self._close() # Status koneksi tidak pasti; email berikutnya membuka koneksi baru
+                raise
+            self._last_used = _time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+smtp_pool = SMTPPool()
 
 def _send_mail_blocking(msg: MIMEText, recipient_email: str):
-    """Fungsi sinkron yang melakukan koneksi dan pengiriman SMTP."""
+    """Fungsi sinkron yang mengirim email lewat koneksi SMTP bersama."""
     try:
-        # Menggunakan koneksi TLS standar
-        with smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
-            server.starttls() 
-            server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-            server.sendmail(settings.EMAIL_SENDER, recipient_email, msg.as_string())
+        smtp_pool.send(recipient_email, msg.as_string())
     except Exception as e:
-        print(f"FAILED TO SEND EMAIL to {recipient_email}: {e}")
+        logger.error("FAILED TO SEND EMAIL to %s: %s", recipient_email, e)
 
 
 
@@ -72,7 +146,7 @@ def check_smtp_connection_blocking() -> bool:
             server.quit()
         return True
     except Exception as e:
-        print(f"SMTP Connection Failed: {e}")
+        logger.error("SMTP Connection Failed: %s", e)
         return False
 
 async def check_smtp_async() -> bool:
@@ -114,6 +114,9 @@ CREATE TABLE anomaly (
     PRIMARY KEY (model_id, session_id) -- 1 sesi bisa dideteksi oleh 1 model
 );
 
+-- PK diawali model_id, jadi join view ke eat_session (ON session_id) butuh index sendiri
+CREATE INDEX idx_anomaly_session ON anomaly (session_id);
+
 -- Tabel untuk data sensor mentah bervolume tinggi
 CREATE TABLE output_sensor (
     "timestamp" TIMESTAMPTZ NOT NULL,
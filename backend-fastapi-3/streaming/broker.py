@@ -1,8 +1,30 @@
 # streaming/broker.py
 import asyncio
-import json
+import logging
 from uuid import UUID
-from typing import Dict, List, Any
+from typing import Dict, List, Set, Any
+try:
+    import orjson
+    def dumps_message(message: Dict[str, Any]) -> str:
+        return orjson.dumps(message).decode()
+except ImportError: # Fallback ke json bawaan
+    import json
+    dumps_message = json.dumps
+
+logger = logging.getLogger(__name__)
+
+# Kapasitas antrian per klien SSE; klien lambat kehilangan pesan tertua, bukan memblokir
+CLIENT_QUEUE_SIZE = 256
+
+def put_drop_oldest(queue: asyncio.Queue, item: Any) -> bool:
+    """put_nowait; jika penuh, buang item tertua dulu. Mengembalikan True bila ada yang dibuang."""
+    try:
+        queue.put_nowait(item)
+        return False
+    except asyncio.QueueFull:
+        queue.get_nowait()
+        queue.put_nowait(item)
+        return True
 
 class StreamingBroker:
     """
@@ -10,33 +32,31 @@ class StreamingBroker:
     pesan ke klien SSE yang terhubung.
     """
     def __init__(self):
-        # Menyimpan daftar antrian (queues) untuk setiap cow_id
-        self.clients: Dict[UUID, List[asyncio.Queue]] = {}
-        self.lock = asyncio.Lock()
+        # Menyimpan himpunan antrian (queues) untuk setiap cow_id; add/discard O(1)
+        self.clients: Dict[UUID, Set[asyncio.Queue]] = {}
+        # Tanpa lock: connect/disconnect/broadcast tidak punya await di tengah
+        # perubahan atau iterasi set, jadi atomik di event loop yang sama.
+        self.dropped_messages = 0
 
     async def connect(self, cow_id: UUID) -> asyncio.Queue:
         """
         Klien baru (dari SSE) terhubung dan mendaftar untuk
         menerima update untuk cow_id tertentu.
         """
-        async with self.lock:
-            queue = asyncio.Queue()
-            # setdefault adalah cara aman untuk membuat list jika belum ada
-            self.clients.setdefault(cow_id, []).append(queue)
-            print(f"(Stream) Klien terhubung untuk Sapi {cow_id}. Total: {len(self.clients[cow_id])}")
-            return queue
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        # setdefault adalah cara aman untuk membuat set jika belum ada
+        self.clients.setdefault(cow_id, set()).add(queue)
+        logger.info("(Stream) Klien terhubung untuk Sapi %s. Total: %s", cow_id, len(self.clients[cow_id]))
+        return queue
 
     async def disconnect(self, cow_id: UUID, queue: asyncio.Queue):
         """Klien (dari SSE) terputus."""
-        async with self.lock:
-            if cow_id in self.clients:
-                try:
-                    self.clients[cow_id].remove(queue)
-                    if not self.clients[cow_id]: # Hapus jika list kosong
-                        del self.clients[cow_id]
-                    print(f"(Stream) Klien terputus untuk Sapi {cow_id}.")
-                except ValueError:
-                    pass # Antrian sudah dihapus
+        queues = self.clients.get(cow_id)
+        if queues is not None and queue in queues:
+            queues.discard(queue)
+            if not queues: # Hapus jika set kosong
+                del self.clients[cow_id]
+            logger.info("(Stream) Klien terputus untuk Sapi %s.", cow_id)
 
     async def broadcast(self, cow_id: UUID, message: Dict[str, Any]):
         """
@@ -45,12 +65,24 @@ class StreamingBroker:
         """
         if cow_id in self.clients:
             # Ubah ke string JSON sekali saja
-            message_str = json.dumps(message) 
+            message_str = dumps_message(message)
             
-            # Kita lakukan iterasi tanpa lock untuk kecepatan.
-            # 'put' pada asyncio.Queue aman untuk thread/task.
+            # Tanpa await: klien lambat tidak menahan publisher (MQTT) dan set
+            # tidak bisa berubah di tengah iterasi.
+            for queue in self.clients[cow_id]:
+                self.dropped_messages += put_drop_oldest(queue, message_str)
+
+    async def broadcast_batch(self, cow_id: UUID, messages: List[Dict[str, Any]]):
+        """
+        Menyebarkan beberapa pesan sekaligus sebagai satu item antrian.
+        Generator SSE membungkus item dengan 'data: ...\n\n', jadi pesan
+        digabung dengan pemisah event SSE agar klien tetap menerima N event
+        terpisah dalam satu kali tulis.
+        """
+        if cow_id in self.clients and messages:
+            message_str = "\n\ndata: ".join(dumps_message(message) for message in messages)
             for queue in self.clients[cow_id]:
-                await queue.put(message_str)
+                self.dropped_messages += put_drop_oldest(queue, message_str)
 
 # Buat satu instance global yang akan digunakan di seluruh aplikasi
 streaming_broker = StreamingBroker()
\ No newline at end of file
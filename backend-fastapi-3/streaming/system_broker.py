@@ -1,7 +1,11 @@
 # streaming/system_broker.py
 import asyncio
-import json
-from typing import Dict, List, Any
+import logging
+from typing import Dict, Set, Any
+
+from streaming.broker import CLIENT_QUEUE_SIZE, put_drop_oldest, dumps_message
+
+logger = logging.getLogger(__name__)
 
 class SystemBroker:
     """
@@ -10,35 +14,32 @@ class SystemBroker:
     """
     def __init__(self):
         # Kunci channel adalah string (misalnya 'global_alerts', 'ml_status')
-        self.clients: Dict[str, List[asyncio.Queue]] = {} 
-        self.lock = asyncio.Lock()
+        self.clients: Dict[str, Set[asyncio.Queue]] = {} 
+        # Tanpa lock: tidak ada await di tengah perubahan/iterasi set
+        self.dropped_messages = 0
 
     async def connect(self, channel_key: str) -> asyncio.Queue:
         """Klien terhubung ke channel sistem yang spesifik."""
-        async with self.lock:
-            queue = asyncio.Queue()
-            self.clients.setdefault(channel_key, []).append(queue)
-            print(f"(SysStream) Client connected to channel: {channel_key}")
-            return queue
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.clients.setdefault(channel_key, set()).add(queue)
+        logger.info("(SysStream) Client connected to channel: %s", channel_key)
+        return queue
 
     async def disconnect(self, channel_key: str, queue: asyncio.Queue):
         """Klien terputus."""
-        async with self.lock:
-            if channel_key in self.clients:
-                try:
-                    self.clients[channel_key].remove(queue)
-                    if not self.clients[channel_key]:
-                        del self.clients[channel_key]
-                    print(f"(SysStream) Client disconnected from channel: {channel_key}")
-                except ValueError:
-                    pass
+        queues = self.clients.get(channel_key)
+        if queues is not None and queue in queues:
+            queues.discard(queue)
+            if not queues:
+                del self.clients[channel_key]
+            logger.info("(SysStream) Client disconnected from channel: %s", channel_key)
 
     async def broadcast(self, channel_key: str, message: Dict[str, Any]):
         """Menyiarkan pesan sistem ke semua klien yang terhubung ke channel_key."""
         if channel_key in self.clients:
-            message_str = json.dumps(message) 
+            message_str = dumps_message(message)
             for queue in self.clients[channel_key]:
-                await queue.put(message_str)
+                self.dropped_messages += put_drop_oldest(queue, message_str)
 
 # Buat instance global
 system_broker = SystemBroker()
\ No newline at end of file
@@ -0,0 +1,41 @@
+# tests/test_model_metrics_codec.py
+import numpy as np
+
+from db.postgresql import _json_dumps, _json_loads
+from ml.isolation_forest import IsolationForest
+from ml.tasks import FEATURE_COUNT, build_model_metrics
+
+
+def _trained_model():
+    rng = np.random.default_rng(0)
+    X_train = rng.normal(size=(50, FEATURE_COUNT)).astype(np.float32)
+    model = IsolationForest(n_estimators=10, contamination=0.05).fit(X_train)
+    return model, X_train
+
+
+def test_trained_model_metrics_roundtrip_through_jsonb_codec():
+    model, X_train = _trained_model()
+
+    metrics = build_model_metrics(model, X_train)
+    decoded = _json_loads(_json_dumps(metrics))
+
+    assert decoded == {
+        "feature_count": FEATURE_COUNT,
+        "session_count": 50,
+        "anomaly_threshold": float(model.threshold_),
+    }
+
+
+def test_codec_accepts_numpy_scalars():
+    # threshold_ mentah adalah numpy.float64; codec tidak boleh gagal karenanya
+    model, X_train = _trained_model()
+
+    decoded = _json_loads(_json_dumps({
+        "anomaly_threshold": model.threshold_,
+        "session_count": np.int64(X_train.shape[0]),
+    }))
+
+    assert decoded == {
+        "anomaly_threshold": float(model.threshold_),
+        "session_count": 50,
+    }
@@ -13,14 +13,15 @@ Date: 2025-11-13
 """
 
 import argparse
+import heapq
+import io
 import sys
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
-import random
+from typing import List, Dict, Iterator, NamedTuple, Optional, Tuple
 import psycopg2
-from psycopg2.extras import execute_batch
 import numpy as np
 from dataclasses import dataclass
+from itertools import islice
 import logging
 
 
@@ -38,6 +39,7 @@ RFID_MAPPING = {
 SHARED_IP = "192.168.1.100"
 FEEDING_TIMES = ["08:00", "14:00"]  # Daily feeding schedule
 SAMPLING_RATE_SECONDS = 1
+IDLE_SAMPLE_INTERVAL = 60  # seconds between readings when no cow is present
 
 # Feeding behavior parameters
 NORMAL_FEEDING_DURATION_MIN = 60  # minutes
@@ -70,9 +72,8 @@ SHORT_FEEDING_DURATION_MIN = 20  # Sick cow feeds for only ~20 min
 # DATA CLASSES
 # ============================================================================
 
-@dataclass
-class SensorReading:
-    """Single sensor reading from a feeder device"""
+class SensorReading(NamedTuple):
+    """Single sensor reading from a feeder device (fields in output_sensor column order)"""
     timestamp: datetime
     device_id: str
     rfid_id: Optional[str]
@@ -103,10 +104,30 @@ class CattleDataSimulator:
         self.n_days = n_days
         self.end_date = start_date + timedelta(days=n_days)
         
-        random.seed(seed)
-        np.random.seed(seed)
+        # Single PCG64 generator for all sampling (deterministic per --seed)
+        self.rng = np.random.default_rng(seed)
         
         self.logger = logging.getLogger(__name__)
+        
+        # Parse FEEDING_TIMES once into offsets from midnight
+        self.feeding_offsets = [
+            timedelta(hours=int(hour), minutes=int(minute))
+            for hour, minute in (t.split(":") for t in FEEDING_TIMES)
+        ]
+        
+        # Per-second offset grid shared by every session (sliced, never rebuilt)
+        max_session_seconds = int(
+            (NORMAL_FEEDING_DURATION_MIN + FEEDING_DURATION_JITTER_MIN) * 60
+        ) + 1
+        self.sec_offsets = np.arange(max_session_seconds)
+        self.sec_deltas = self.sec_offsets.astype("timedelta64[s]")
+        
+        # (low, high) bounds for the per-session scalar parameters, so they
+        # come from a single rng.uniform call
+        self.session_param_bounds = (
+            np.array([INITIAL_WEIGHT_MIN, CONSUMPTION_RATE_MIN, TEMP_MIN, -TEMP_DRIFT_RATE]),
+            np.array([INITIAL_WEIGHT_MAX, CONSUMPTION_RATE_MAX, TEMP_MAX, TEMP_DRIFT_RATE]),
+        )
     
     def generate_feeding_schedule(self) -> Dict[str, List[FeedingSession]]:
         """
@@ -114,15 +135,19 @@ class CattleDataSimulator:
         Includes ground truth anomalies.
         """
         schedule = {device_id: [] for device_id in DEVICE_IDS}
+        first_midnight = self.start_date.replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
         
         for day in range(self.n_days):
-            current_date = self.start_date + timedelta(days=day)
+            day_midnight = first_midnight + timedelta(days=day)
             day_number = day + 1  # 1-indexed for clarity
+            base_times = [day_midnight + offset for offset in self.feeding_offsets]
             
             for device_id in DEVICE_IDS:
-                for feeding_time_str in FEEDING_TIMES:
+                for base_time in base_times:
                     session = self._create_feeding_session(
-                        device_id, current_date, feeding_time_str, day_number
+                        device_id, base_time, day_number
                     )
                     if session:  # May be None for no-show anomalies
                         schedule[device_id].append(session)
@@ -132,27 +157,23 @@ class CattleDataSimulator:
     def _create_feeding_session(
         self, 
         device_id: str, 
-        date: datetime, 
-        time_str: str,
+        base_time: datetime,
         day_number: int
     ) -> Optional[FeedingSession]:
         """Create a single feeding session with potential anomalies"""
         
-        # Parse base time
-        hour, minute = map(int, time_str.split(":"))
-        base_time = date.replace(hour=hour, minute=minute, second=0, microsecond=0)
-        
         # Add random jitter
-        jitter_seconds = random.randint(
+        jitter_seconds = int(self.rng.integers(
             -FEEDING_START_JITTER_MIN * 60,
-            FEEDING_START_JITTER_MIN * 60
-        )
+            FEEDING_START_JITTER_MIN * 60,
+            endpoint=True
+        ))
         start_time = base_time + timedelta(seconds=jitter_seconds)
         
         # Check for anomalies
         is_anomaly = False
         anomaly_type = None
-        duration_min = NORMAL_FEEDING_DURATION_MIN + random.uniform(
+        duration_min = NORMAL_FEEDING_DURATION_MIN + self.rng.uniform(
             -FEEDING_DURATION_JITTER_MIN, FEEDING_DURATION_JITTER_MIN
         )
         
@@ -160,7 +181,7 @@ class CattleDataSimulator:
         if device_id == "1" and SICK_COW_1_DAYS[0] <= day_number <= SICK_COW_1_DAYS[1]:
             is_anomaly = True
             anomaly_type = "short_feeding"
-            duration_min = SHORT_FEEDING_DURATION_MIN + random.uniform(-5, 5)
+            duration_min = SHORT_FEEDING_DURATION_MIN + self.rng.uniform(-5, 5)
             self.logger.info(
                 f"Anomaly: Device {device_id} day {day_number} - Short feeding ({duration_min:.1f} min)"
             )
@@ -181,101 +202,78 @@ class CattleDataSimulator:
         )
     
     def generate_session_data(self, session: FeedingSession) -> List[SensorReading]:
-        """Generate sensor readings for a single feeding session"""
+        """Generate sensor readings for a single feeding session (vectorized)"""
         
-        readings = []
         device_id = session.device_id
         rfid_id = RFID_MAPPING[device_id]
         
         # Session parameters
         start_time = session.start_time
         duration_seconds = int(session.duration_min * 60)
+        feeding_seconds = max(0, duration_seconds - 2 * BUFFER_TIME_SECONDS)
+        n_samples = 2 * BUFFER_TIME_SECONDS + feeding_seconds
+        
+        # Weight + temperature parameters, drawn together:
+        # (initial_weight, consumption_rate, start_temp, temp_drift)
+        initial_weight, consumption_rate, start_temp, temp_drift = self.rng.uniform(
+            *self.session_param_bounds
+        ).tolist()
+        
+        if n_samples > self.sec_offsets.size:
+            self.sec_offsets = np.arange(n_samples)
+            self.sec_deltas = self.sec_offsets.astype("timedelta64[s]")
+        offsets = self.sec_offsets[:n_samples]
+        
+        # Temperature steps every TEMP_UPDATE_INTERVAL seconds (including t=0).
+        # Drift is constant, so clipping the cumulative value matches clipping
+        # after every step.
+        temp_steps = offsets // TEMP_UPDATE_INTERVAL + 1
+        temps = np.clip(
+            start_temp + temp_drift * (TEMP_UPDATE_INTERVAL / 60) * temp_steps,
+            TEMP_MIN, TEMP_MAX
+        ).round(2)
+        
+        feeding = slice(BUFFER_TIME_SECONDS, BUFFER_TIME_SECONDS + feeding_seconds)
+        
+        # Weight level: constant in the start buffer (cow approaches), linear
+        # consumption while feeding (closed form, no cumsum pass), constant at
+        # the final level in the end buffer (cow leaves)
+        final_weight = initial_weight - consumption_rate * feeding_seconds
+        level = np.full(n_samples, initial_weight)
+        level[feeding] -= consumption_rate * offsets[1:feeding_seconds + 1]
+        level[feeding.stop:] = final_weight
+        
+        # Noise for the whole session from one draw: half std in the buffers,
+        # full std while feeding
+        noise = self.rng.standard_normal(n_samples)
+        noise *= WEIGHT_NOISE_STD * 0.5
+        noise[feeding] *= 2
+        
+        # Spikes and their sign from one uniform draw:
+        # u < P/2 -> -1, P/2 <= u < P -> +1, otherwise no spike
+        spike_draw = self.rng.random(feeding_seconds)
+        noise[feeding] += SPIKE_MAGNITUDE * (
+            (spike_draw < SPIKE_PROBABILITY).astype(float)
+            - 2 * (spike_draw < SPIKE_PROBABILITY / 2)
+        )
         
-        # Weight parameters
-        initial_weight = random.uniform(INITIAL_WEIGHT_MIN, INITIAL_WEIGHT_MAX)
-        consumption_rate = random.uniform(CONSUMPTION_RATE_MIN, CONSUMPTION_RATE_MAX)
-        
-        # Temperature parameters
-        current_temp = random.uniform(TEMP_MIN, TEMP_MAX)
-        temp_drift = random.uniform(-TEMP_DRIFT_RATE, TEMP_DRIFT_RATE)
-        
-        current_weight = initial_weight
-        
-        # Buffer phase (start): Cow approaches, no eating yet
-        for i in range(BUFFER_TIME_SECONDS):
-            timestamp = start_time + timedelta(seconds=i)
-            
-            # Update temperature every 60s
-            if i % TEMP_UPDATE_INTERVAL == 0:
-                current_temp += temp_drift * (TEMP_UPDATE_INTERVAL / 60)
-                current_temp = np.clip(current_temp, TEMP_MIN, TEMP_MAX)
-            
-            # Weight stays constant with small noise
-            weight = current_weight + np.random.normal(0, WEIGHT_NOISE_STD * 0.5)
-            
-            readings.append(SensorReading(
-                timestamp=timestamp,
-                device_id=device_id,
-                rfid_id=rfid_id,
-                weight=max(0, weight),
-                temperature_c=round(current_temp, 2),
-                ip=SHARED_IP
-            ))
+        # Round once per array, at the load cell's 10 g resolution
+        weights = np.maximum(0, level + noise).round(2)
+        timestamps = np.datetime64(start_time) + self.sec_deltas[:n_samples]
         
-        # Active feeding phase
-        feeding_seconds = duration_seconds - 2 * BUFFER_TIME_SECONDS
-        for i in range(feeding_seconds):
-            timestamp = start_time + timedelta(seconds=BUFFER_TIME_SECONDS + i)
-            
-            # Update temperature
-            if (BUFFER_TIME_SECONDS + i) % TEMP_UPDATE_INTERVAL == 0:
-                current_temp += temp_drift * (TEMP_UPDATE_INTERVAL / 60)
-                current_temp = np.clip(current_temp, TEMP_MIN, TEMP_MAX)
-            
-            # Decrease weight (consumption)
-            current_weight -= consumption_rate
-            
-            # Add noise
-            noise = np.random.normal(0, WEIGHT_NOISE_STD)
-            
-            # Random spike
-            if random.random() < SPIKE_PROBABILITY:
-                noise += random.choice([-1, 1]) * SPIKE_MAGNITUDE
-            
-            weight = current_weight + noise
-            
-            readings.append(SensorReading(
-                timestamp=timestamp,
+        return [
+            SensorReading(
+                timestamp=ts,
                 device_id=device_id,
                 rfid_id=rfid_id,
-                weight=max(0, weight),
-                temperature_c=round(current_temp, 2),
+                weight=weight,
+                temperature_c=temp,
                 ip=SHARED_IP
-            ))
-        
-        # Buffer phase (end): Cow leaves
-        for i in range(BUFFER_TIME_SECONDS):
-            timestamp = start_time + timedelta(
-                seconds=BUFFER_TIME_SECONDS + feeding_seconds + i
             )
-            
-            if (BUFFER_TIME_SECONDS + feeding_seconds + i) % TEMP_UPDATE_INTERVAL == 0:
-                current_temp += temp_drift * (TEMP_UPDATE_INTERVAL / 60)
-                current_temp = np.clip(current_temp, TEMP_MIN, TEMP_MAX)
-            
-            # Weight stays constant
-            weight = current_weight + np.random.normal(0, WEIGHT_NOISE_STD * 0.5)
-            
-            readings.append(SensorReading(
-                timestamp=timestamp,
-                device_id=device_id,
-                rfid_id=rfid_id,
-                weight=max(0, weight),
-                temperature_c=round(current_temp, 2),
-                ip=SHARED_IP
-            ))
-        
-        return readings
+            for ts, weight, temp in zip(
+                timestamps.tolist(), weights.tolist(), temps.tolist()
+            )
+        ]
     
     def generate_idle_data(
         self, 
@@ -287,78 +285,94 @@ class CattleDataSimulator:
         Generate idle sensor readings (no cow present) between feeding sessions.
         Sample at lower rate (every 60s) to reduce data volume.
         """
-        readings = []
-        
-        current_time = start_time
-        current_temp = random.uniform(TEMP_MIN, TEMP_MAX)
-        temp_drift = random.uniform(-TEMP_DRIFT_RATE / 2, TEMP_DRIFT_RATE / 2)
+        sample_step = timedelta(seconds=IDLE_SAMPLE_INTERVAL)
+        n_samples = -((start_time - end_time) // sample_step)  # ceil division
+        if n_samples <= 0:
+            return []
+        
+        start_temp = self.rng.uniform(TEMP_MIN, TEMP_MAX)
+        temp_drift = self.rng.uniform(-TEMP_DRIFT_RATE / 2, TEMP_DRIFT_RATE / 2)
+        
+        # Constant drift, so clipping the cumulative value matches per-step clip
+        temps = np.round(np.clip(
+            start_temp + temp_drift * np.arange(1, n_samples + 1),
+            TEMP_MIN, TEMP_MAX
+        ), 2)
+        
+        timestamps = np.datetime64(start_time) + (
+            np.arange(n_samples) * np.timedelta64(IDLE_SAMPLE_INTERVAL, "s")
+        )
         
-        while current_time < end_time:
-            # Update temperature
-            current_temp += temp_drift
-            current_temp = np.clip(current_temp, TEMP_MIN, TEMP_MAX)
-            
-            readings.append(SensorReading(
-                timestamp=current_time,
+        return [
+            SensorReading(
+                timestamp=ts,
                 device_id=device_id,
                 rfid_id=None,  # No cow present
                 weight=0.0,  # No food loaded
-                temperature_c=round(current_temp, 2),
+                temperature_c=temp,
                 ip=SHARED_IP
-            ))
+            )
+            for ts, temp in zip(timestamps.tolist(), temps.tolist())
+        ]
+    
+    def _iter_device_data(
+        self, device_id: str, sessions: List[FeedingSession]
+    ) -> Iterator[SensorReading]:
+        """Yield one device's readings in time order, one idle/session block at a time"""
+        
+        self.logger.info(f"Generating data for device {device_id}...")
+        device_start = self.start_date
+        
+        for session in sorted(sessions, key=lambda s: s.start_time):
+            # Generate idle data before session
+            if device_start < session.start_time:
+                yield from self.generate_idle_data(
+                    device_id, device_start, session.start_time
+                )
+            
+            # Generate session data
+            yield from self.generate_session_data(session)
             
-            current_time += timedelta(seconds=60)  # Sample every minute
+            # Update next start time
+            device_start = session.start_time + timedelta(minutes=session.duration_min)
         
-        return readings
+        # Generate idle data after last session until end date
+        if device_start < self.end_date:
+            yield from self.generate_idle_data(device_id, device_start, self.end_date)
     
-    def generate_all_data(self) -> List[SensorReading]:
-        """Generate complete dataset for all devices"""
+    def generate_all_data(self) -> Iterator[SensorReading]:
+        """
+        Lazily generate the complete dataset for all devices, ordered by
+        (timestamp, device_id). Each device stream is already time-ordered, so
+        they are merged instead of materializing and sorting the full month.
+        """
         
         self.logger.info(f"Generating feeding schedule for {self.n_days} days...")
         schedule = self.generate_feeding_schedule()
         
-        all_readings = []
-        
-        for device_id in DEVICE_IDS:
-            self.logger.info(f"Generating data for device {device_id}...")
-            
-            sessions = sorted(schedule[device_id], key=lambda s: s.start_time)
-            device_start = self.start_date
-            
-            for session in sessions:
-                # Generate idle data before session
-                if device_start < session.start_time:
-                    idle_readings = self.generate_idle_data(
-                        device_id, device_start, session.start_time
-                    )
-                    all_readings.extend(idle_readings)
-                
-                # Generate session data
-                session_readings = self.generate_session_data(session)
-                all_readings.extend(session_readings)
-                
-                # Update next start time
-                session_end = session.start_time + timedelta(minutes=session.duration_min)
-                device_start = session_end
-            
-            # Generate idle data after last session until end date
-            if device_start < self.end_date:
-                idle_readings = self.generate_idle_data(
-                    device_id, device_start, self.end_date
-                )
-                all_readings.extend(idle_readings)
-        
-        # Sort all readings by timestamp
-        all_readings.sort(key=lambda r: (r.timestamp, r.device_id))
-        
-        self.logger.info(f"Generated {len(all_readings):,} total readings")
-        return all_readings
+        return heapq.merge(
+            *(self._iter_device_data(device_id, schedule[device_id])
+              for device_id in DEVICE_IDS),
+            key=lambda r: (r.timestamp, r.device_id)
+        )
 
 
 # ============================================================================
 # DATABASE OPERATIONS
 # ============================================================================
 
+COPY_NULL = "\\N"  # NULL marker for COPY text format
+
+# Secondary indexes on output_sensor (see backend-fastapi-3/setup.sql).
+# With --defer-indexes they are dropped before the load and rebuilt once after.
+OUTPUT_SENSOR_INDEXES = {
+    "idx_output_device_time":
+        'CREATE INDEX idx_output_device_time ON output_sensor (device_id, "timestamp" DESC)',
+    "idx_output_rfid_time":
+        'CREATE INDEX idx_output_rfid_time ON output_sensor (rfid_id, "timestamp" DESC)',
+}
+
+
 class TimescaleDBWriter:
     """Handle TimescaleDB connections and batch inserts"""
     
@@ -366,8 +380,19 @@ class TimescaleDBWriter:
         self.conn_string = conn_string
         self.logger = logging.getLogger(__name__)
     
-    def insert_readings(self, readings: List[SensorReading], batch_size: int = 5000):
-        """Insert sensor readings into output_sensor table"""
+    def insert_readings(
+        self,
+        readings: Iterator[SensorReading],
+        batch_size: int = 5000,
+        defer_indexes: bool = False
+    ) -> int:
+        """
+        Insert sensor readings into output_sensor table and return the row count.
+        Readings are consumed lazily, so only one batch is held in memory.
+        If defer_indexes is set, secondary indexes are rebuilt once after the
+        load instead of being updated per row. This holds an exclusive lock on
+        output_sensor until commit, so only use it when the backend is idle.
+        """
         
         self.logger.info(f"Connecting to TimescaleDB...")
         conn = psycopg2.connect(self.conn_string)
@@ -375,40 +400,54 @@ class TimescaleDBWriter:
         try:
             cursor = conn.cursor()
             
-            # Prepare data for batch insert
-            insert_query = """
-                INSERT INTO output_sensor 
+            # Synthetic data only: don't wait for the WAL flush on commit.
+            # Never copy this into production ingest paths.
+            cursor.execute("SET LOCAL synchronous_commit TO OFF")
+            
+            if defer_indexes:
+                for index_name in OUTPUT_SENSOR_INDEXES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+                self.logger.info("Dropped secondary indexes for bulk load")
+            
+            # Stream each batch through COPY: one round-trip per batch and no
+            # per-row INSERT parsing on the server
+            copy_query = """
+                COPY output_sensor 
                 (timestamp, device_id, rfid_id, weight, temperature_c, ip)
-                VALUES (%s, %s, %s, %s, %s, %s)
+                FROM STDIN
             """
             
-            total_batches = (len(readings) + batch_size - 1) // batch_size
+            readings = iter(readings)
+            total_rows = 0
+            current_batch = 0
             
-            for batch_idx in range(0, len(readings), batch_size):
-                batch = readings[batch_idx:batch_idx + batch_size]
-                
-                batch_data = [
-                    (
-                        r.timestamp,
-                        r.device_id,
-                        r.rfid_id,
-                        r.weight,
-                        r.temperature_c,
-                        r.ip
-                    )
+            while batch := list(islice(readings, batch_size)):
+                buffer = io.StringIO()
+                buffer.writelines(
+                    f"{r.timestamp.isoformat()}\t{r.device_id}\t"
+                    f"{COPY_NULL if r.rfid_id is None else r.rfid_id}\t"
+                    f"{r.weight}\t{r.temperature_c}\t{r.ip}\n"
                     for r in batch
-                ]
-                
-                execute_batch(cursor, insert_query, batch_data, page_size=batch_size)
-                conn.commit()
+                )
+                buffer.seek(0)
+                cursor.copy_expert(copy_query, buffer)
                 
-                current_batch = batch_idx // batch_size + 1
+                current_batch += 1
+                total_rows += len(batch)
                 self.logger.info(
-                    f"Inserted batch {current_batch}/{total_batches} "
-                    f"({len(batch):,} rows)"
+                    f"Inserted batch {current_batch} "
+                    f"({len(batch):,} rows, {total_rows:,} total)"
                 )
             
-            self.logger.info(f"✓ Successfully inserted {len(readings):,} readings")
+            if defer_indexes:
+                for create_sql in OUTPUT_SENSOR_INDEXES.values():
+                    cursor.execute(create_sql)
+                self.logger.info("Rebuilt secondary indexes")
+            
+            # Single commit for the whole backfill
+            conn.commit()
+            self.logger.info(f"✓ Successfully inserted {total_rows:,} readings")
+            return total_rows
             
         except Exception as e:
             conn.rollback()
@@ -427,42 +466,32 @@ class TimescaleDBWriter:
         try:
             cursor = conn.cursor()
             
-            # Count total rows
-            cursor.execute("""
-                SELECT COUNT(*) FROM output_sensor
-                WHERE timestamp >= %s AND timestamp < %s
-            """, (start_date, start_date + timedelta(days=n_days)))
-            
-            total_rows = cursor.fetchone()[0]
-            self.logger.info(f"Total rows in range: {total_rows:,}")
-            
-            # Count by device
+            # Per-device totals and feeding-session stats in a single scan
+            # (total is summed here instead of a separate COUNT(*))
             cursor.execute("""
-                SELECT device_id, COUNT(*) 
+                SELECT device_id,
+                       COUNT(*),
+                       COUNT(*) FILTER (WHERE rfid_id IS NOT NULL),
+                       MIN(timestamp) FILTER (WHERE rfid_id IS NOT NULL),
+                       MAX(timestamp) FILTER (WHERE rfid_id IS NOT NULL)
                 FROM output_sensor
                 WHERE timestamp >= %s AND timestamp < %s
                 GROUP BY device_id
                 ORDER BY device_id
             """, (start_date, start_date + timedelta(days=n_days)))
             
-            for device_id, count in cursor.fetchall():
+            device_stats = cursor.fetchall()
+            total_rows = sum(row[1] for row in device_stats)
+            self.logger.info(f"Total rows in range: {total_rows:,}")
+            for device_id, count, *_ in device_stats:
                 self.logger.info(f"  Device {device_id}: {count:,} rows")
             
-            # Sample some feeding sessions (where rfid_id is not null)
-            cursor.execute("""
-                SELECT device_id, COUNT(*), 
-                       MIN(timestamp), MAX(timestamp)
-                FROM output_sensor
-                WHERE timestamp >= %s AND timestamp < %s
-                  AND rfid_id IS NOT NULL
-                GROUP BY device_id
-                ORDER BY device_id
-            """, (start_date, start_date + timedelta(days=n_days)))
-            
             self.logger.info("\nFeeding session summary (rfid_id present):")
-            for device_id, count, min_ts, max_ts in cursor.fetchall():
+            for device_id, _, feeding_count, min_ts, max_ts in device_stats:
+                if not feeding_count:
+                    continue
                 self.logger.info(
-                    f"  Device {device_id}: {count:,} readings "
+                    f"  Device {device_id}: {feeding_count:,} readings "
                     f"from {min_ts} to {max_ts}"
                 )
             
@@ -533,6 +562,13 @@ Example:
         help="PostgreSQL/TimescaleDB connection string"
     )
     
+    parser.add_argument(
+        "--defer-indexes",
+        action="store_true",
+        help="Drop secondary indexes during the load and rebuild them afterwards "
+             "(locks output_sensor; use on an idle database)"
+    )
+    
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -575,36 +611,42 @@ def main():
     # Generate data
     simulator = CattleDataSimulator(start_date, args.n_days, args.seed)
     
-    logger.info("\n📊 Generating sensor data...")
-    start_time = datetime.now()
-    
     readings = simulator.generate_all_data()
-    
-    generation_time = (datetime.now() - start_time).total_seconds()
-    logger.info(f"✓ Data generation completed in {generation_time:.1f}s")
-    logger.info(f"✓ Generated {len(readings):,} sensor readings")
-    
-    # Estimate data size
-    estimated_size_mb = len(readings) * 100 / 1024 / 1024  # ~100 bytes per row
-    logger.info(f"✓ Estimated data size: ~{estimated_size_mb:.1f} MB")
+    start_time = datetime.now()
     
     if args.dry_run:
         logger.info("\n🔍 DRY RUN MODE - No data will be inserted")
+        logger.info("\n📊 Generating sensor data...")
         logger.info(f"Sample readings (first 5):")
-        for reading in readings[:5]:
+        sample = list(islice(readings, 5))
+        for reading in sample:
             logger.info(f"  {reading}")
+        n_readings = len(sample) + sum(1 for _ in readings)
+        
+        generation_time = (datetime.now() - start_time).total_seconds()
+        logger.info(f"✓ Data generation completed in {generation_time:.1f}s")
+        logger.info(f"✓ Generated {n_readings:,} sensor readings")
+        
+        # Estimate data size
+        estimated_size_mb = n_readings * 100 / 1024 / 1024  # ~100 bytes per row
+        logger.info(f"✓ Estimated data size: ~{estimated_size_mb:.1f} MB")
         return
     
-    # Insert into database
-    logger.info(f"\n💾 Inserting data into TimescaleDB...")
+    # Generate and insert into database (streamed batch by batch)
+    logger.info(f"\n💾 Generating and inserting data into TimescaleDB...")
     db_writer = TimescaleDBWriter(args.pg_conn)
     
-    insert_start = datetime.now()
-    db_writer.insert_readings(readings, args.batch_size)
-    insert_time = (datetime.now() - insert_start).total_seconds()
+    n_readings = db_writer.insert_readings(
+        readings, args.batch_size, args.defer_indexes
+    )
+    insert_time = (datetime.now() - start_time).total_seconds()
+    
+    logger.info(f"✓ Generation + insertion completed in {insert_time:.1f}s")
+    logger.info(f"✓ Insert rate: {n_readings / insert_time:.0f} rows/second")
     
-    logger.info(f"✓ Database insertion completed in {insert_time:.1f}s")
-    logger.info(f"✓ Insert rate: {len(readings) / insert_time:.0f} rows/second")
+    # Estimate data size
+    estimated_size_mb = n_readings * 100 / 1024 / 1024  # ~100 bytes per row
+    logger.info(f"✓ Estimated data size: ~{estimated_size_mb:.1f} MB")
     
     # Verify
     logger.info(f"\n🔍 Verifying inserted data...")